@@ -1,4 +1,12 @@
+import os
+
+# Serverless : modèles et index chargés à la première requête qui en a besoin,
+# et pas de cycle lifespan (Mangum le relancerait à chaque invocation).
+# Sans lifespan, rien d'autre ne chargerait les modèles : le mode paresseux est donc
+# imposé, même si LAZY_LOADING=0 est défini dans l'environnement du déploiement.
+os.environ["LAZY_LOADING"] = "1"
+
 from main import app
 from mangum import Mangum  # adaptateur ASGI -> AWS Lambda-like
 
-handler = Mangum(app)
+handler = Mangum(app, lifespan="off")
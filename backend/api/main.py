@@ -1,18 +1,45 @@
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import IdentityResponder
 from pydantic import BaseModel
 import pandas as pd
 import faiss
-from sentence_transformers import SentenceTransformer
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, contextmanager
+import contextvars
 import logging
 import numpy as np
 import re
 import ast # For safe evaluation of string-represented lists
+import os
+import tempfile
+import json
+import hashlib
+import hmac
+import pickle
+import random
+import shutil
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import OrderedDict, deque
 from typing import List, Dict, Optional
 from pathlib import Path
 
+# Dépendances optionnelles : encodeur JSON rapide et compression brotli
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 # Configuration du logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -21,6 +48,48 @@ logger = logging.getLogger(__name__)
 # Utiliser un dictionnaire pour stocker les modèles et données chargés
 ml_models = {}
 
+# --- Configuration (variables d'environnement) ---
+# Mode basse mémoire : profils compacts (codes catégoriels + blob texte mappé en mémoire)
+# et embeddings quantifiés (float16 ou int8) au lieu de float32.
+LOW_MEMORY_MODE = os.getenv("LOW_MEMORY_MODE", "0") == "1"
+EMBEDDINGS_DTYPE = os.getenv("EMBEDDINGS_DTYPE", "float16")  # "float16" ou "int8" (mode basse mémoire)
+# Blobs écrits dans un sous-répertoire par processus (voir profile_blob_dir) : plusieurs workers uvicorn
+# ne tronquent ni ne décalent les blobs les uns des autres
+PROFILE_BLOB_DIR = Path(os.getenv("PROFILE_BLOB_DIR", Path(tempfile.gettempdir()) / "moteur_matching_blob"))
+# Chargement paresseux (serverless) : modèle et index chargés à la première requête qui en a besoin
+LAZY_LOADING = os.getenv("LAZY_LOADING", "0") == "1"
+# Snapshot de déploiement précalculé (python build_snapshot.py) : poids du modèle, embeddings, index FAISS
+SNAPSHOT_PATH = Path(os.getenv("SNAPSHOT_PATH", Path(__file__).resolve().parent.parent / "snapshot"))
+# Matching inverse : nombre d'offres ouvertes réévaluées lors de l'ajout d'un profil
+OFFER_FANOUT = int(os.getenv("OFFER_FANOUT", "20"))
+# Similarité cosinus minimale pour classer un texte sur un intitulé de la cartographie des métiers
+ROLE_MIN_SIMILARITY = float(os.getenv("ROLE_MIN_SIMILARITY", "0.5"))
+# Taille du pool FAISS scoré, en multiple de top_k (niveau de service complet)
+SEARCH_POOL_FACTOR = int(os.getenv("SEARCH_POOL_FACTOR", "5"))
+# Pagination : classements complets gardés en cache pour servir les pages suivantes sans recalcul
+RANKING_CACHE_SIZE = int(os.getenv("RANKING_CACHE_SIZE", "256"))
+RANKING_CACHE_TTL = float(os.getenv("RANKING_CACHE_TTL", "600"))  # secondes
+# Taille minimale (octets) d'une réponse avant compression gzip / br
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1000"))
+# Trace de classement : fraction des requêtes tracées (0 = uniquement sur demande) et nombre de traces conservées
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+TRACE_STORE_SIZE = int(os.getenv("TRACE_STORE_SIZE", "200"))
+# Budget de latence par défaut d'une requête /match ou /search (ms, 0 = pas de budget ;
+# surchargé par l'en-tête X-Latency-Budget-Ms) et cache des embeddings d'offres
+LATENCY_BUDGET_MS = float(os.getenv("LATENCY_BUDGET_MS", "0"))
+OFFER_EMBEDDING_CACHE_SIZE = int(os.getenv("OFFER_EMBEDDING_CACHE_SIZE", "1024"))
+# Profilage à la demande : jeton admin (profilage désactivé si vide), nombre de profils par fenêtre,
+# profils conservés, et nombre de requêtes récentes gardées pour GET /slow_requests
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+PROFILE_RATE_LIMIT = int(os.getenv("PROFILE_RATE_LIMIT", "5"))
+PROFILE_RATE_WINDOW = float(os.getenv("PROFILE_RATE_WINDOW", "60"))  # secondes
+PROFILE_STORE_SIZE = int(os.getenv("PROFILE_STORE_SIZE", "20"))
+SLOW_REQUEST_WINDOW = int(os.getenv("SLOW_REQUEST_WINDOW", "500"))
+# Viviers de profils par client (paramètre `pool`) : un répertoire par vivier (profiles.csv + état calculé),
+# et mémoire maximale des viviers résidents avant éviction du moins récemment utilisé (Mo, 0 = sans limite)
+POOLS_DIR = Path(os.getenv("POOLS_DIR", Path(__file__).resolve().parent.parent / "pools"))
+POOL_MEMORY_BUDGET_MB = float(os.getenv("POOL_MEMORY_BUDGET_MB", "0"))
+
 # --- Modèles Pydantic (définis avant les fonctions qui les utilisent) ---
 class MatchExplanation(BaseModel):
     strengths: List[str]  # Points forts du candidat
@@ -28,65 +97,772 @@ class MatchExplanation(BaseModel):
     skills_match_score: float  # Score de correspondance des compétences (0-1)
     experience_match_score: float  # Score de correspondance de l'expérience (0-1)
 
+# --- Stockage compact des profils (mode basse mémoire) ---
+class CompactProfileStore:
+    """
+    Représentation compacte des profils en mémoire.
+    - Colonnes à faible cardinalité stockées en codes catégoriels (pd.Categorical).
+    - Colonnes numériques stockées en tableaux numpy typés.
+    - Colonnes texte (full_text, hard_skills, ...) écrites dans un blob sur disque
+      indexé par offsets et lu via np.memmap uniquement pour les profils demandés.
+    """
+    CATEGORICAL_COLUMNS = ["localisation", "mobilite", "disponibilite", "diplomes", "certifications", "poste_recherche"]
+
+    def __init__(self, df: pd.DataFrame, blob_dir: Path):
+        self.columns = list(df.columns)
+        self.blob_dir = Path(blob_dir)
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+        self.numeric = {}
+        self.categorical = {}
+        self.text_offsets = {}
+        self.text_blobs = {}
+        for col in self.columns:
+            series = df[col]
+            if pd.api.types.is_integer_dtype(series):
+                values = series.to_numpy(dtype=np.int64)
+                self.numeric[col] = values.astype(self.int_dtype(values, np.int32 if col == "id" else np.int16))
+            elif pd.api.types.is_numeric_dtype(series):
+                self.numeric[col] = series.to_numpy(dtype=np.float32)
+            elif col in self.CATEGORICAL_COLUMNS:
+                self.categorical[col] = pd.Categorical(series.astype(str))
+            else:
+                self._write_blob(col, series.astype(str).tolist())
+
+    @staticmethod
+    def int_dtype(values: np.ndarray, minimum=np.int16):
+        """Plus petit type entier (au moins `minimum`) contenant toutes les valeurs, sans débordement."""
+        for dtype in (np.int16, np.int32, np.int64):
+            if np.dtype(dtype).itemsize < np.dtype(minimum).itemsize:
+                continue
+            info = np.iinfo(dtype)
+            if len(values) == 0 or (values.min() >= info.min and values.max() <= info.max):
+                return dtype
+        return np.int64
+
+    def _blob_path(self, col: str) -> Path:
+        return self.blob_dir / f"{col}.blob"
+
+    def _write_blob(self, col: str, values: List[str]):
+        encoded = [v.encode("utf-8") for v in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(b) for b in encoded])
+        with open(self._blob_path(col), "wb") as f:
+            for b in encoded:
+                f.write(b)
+        self.text_offsets[col] = offsets
+        self._open_blob(col)
+
+    def _open_blob(self, col: str):
+        # np.memmap refuse un fichier vide
+        if self.text_offsets[col][-1] == 0:
+            self.text_blobs[col] = np.zeros(0, dtype=np.uint8)
+        else:
+            self.text_blobs[col] = np.memmap(self._blob_path(col), dtype=np.uint8, mode="r")
+
+    def __len__(self) -> int:
+        return len(self.numeric["id"]) if "id" in self.numeric else 0
+
+    def get_text(self, col: str, idx: int) -> str:
+        offsets = self.text_offsets[col]
+        return bytes(self.text_blobs[col][offsets[idx]:offsets[idx + 1]]).decode("utf-8")
+
+    def get_value(self, col: str, idx: int):
+        if col in self.numeric:
+            return self.numeric[col][idx].item()
+        if col in self.categorical:
+            return self.categorical[col][idx]
+        if col in self.text_offsets:
+            return self.get_text(col, idx)
+        raise KeyError(col)
+
+    def row(self, idx: int) -> Dict:
+        """Reconstruit un profil complet (dict) à partir des codes et du blob."""
+        return {col: self.get_value(col, idx) for col in self.columns}
+
+    def column(self, col: str) -> np.ndarray:
+        """Retourne une colonne numérique ou catégorielle (sans matérialiser les textes)."""
+        if col in self.numeric:
+            return self.numeric[col]
+        return np.asarray(self.categorical[col])
+
+    def append(self, new_row: Dict):
+        """Ajoute un profil (utilisé par /add_profile)."""
+        for col in list(new_row.keys()):
+            if col not in self.columns:
+                # Nouvelle colonne : valeurs vides pour les profils existants
+                self.columns.append(col)
+                self.categorical[col] = pd.Categorical([""] * len(self))
+        for col in self.columns:
+            value = new_row.get(col, "")
+            if col in self.numeric:
+                current = self.numeric[col]
+                if np.issubdtype(current.dtype, np.integer):
+                    # Élargit la colonne si la nouvelle valeur ne tient pas dans le type actuel
+                    new = np.array([value], dtype=np.int64)
+                    dtype = self.int_dtype(new, current.dtype)
+                    self.numeric[col] = np.append(current.astype(dtype, copy=False), new.astype(dtype))
+                else:
+                    self.numeric[col] = np.append(current, np.array([value], dtype=current.dtype))
+            elif col in self.categorical:
+                current = self.categorical[col]
+                value = str(value)
+                if value not in current.categories:
+                    current = current.add_categories([value])
+                self.categorical[col] = pd.Categorical(np.append(np.asarray(current, dtype=object), value), categories=current.categories)
+            else:
+                encoded = str(value).encode("utf-8")
+                with open(self._blob_path(col), "ab") as f:
+                    f.write(encoded)
+                offsets = self.text_offsets[col]
+                self.text_offsets[col] = np.append(offsets, offsets[-1] + len(encoded))
+                self._open_blob(col)
+
+    def nbytes(self) -> int:
+        """Octets résidents en mémoire (hors blob mappé, géré par le cache de pages de l'OS)."""
+        total = sum(a.nbytes for a in self.numeric.values())
+        total += sum(a.nbytes for a in self.text_offsets.values())
+        for cat in self.categorical.values():
+            total += cat.codes.nbytes + int(cat.categories.memory_usage(deep=True))
+        return total
+
+    def __getstate__(self):
+        # Les blobs ne sont pas sérialisés : ils sont re-mappés depuis blob_dir au chargement
+        state = self.__dict__.copy()
+        state["text_blobs"] = {}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        for col in self.text_offsets:
+            self._open_blob(col)
+
+# --- Cartographie des métiers du numérique ---
+NO_JOB_TITLE = -2  # Profil sans intitulé de poste déclaré
+NOT_DIGITAL_JOB = -1  # Intitulé hors cartographie / rôle non reconnu
+ROLE_TITLES_PER_PROFILE = 6  # Intitulés retenus par profil (intitulé déclaré, puis postes cités dans ses expériences)
+
+class JobCartography:
+    """
+    Cartographie Famille > Metiers > Poste chargée une seule fois au démarrage :
+    - tables de hachage intitulé -> code, et codes métier / famille de chaque intitulé,
+    - matrice d'embeddings normalisés des intitulés, pour classer offres et profils
+      par intitulé le plus proche.
+    """
+    def __init__(self, df_metiers: pd.DataFrame, model, embeddings: Optional[np.ndarray] = None):
+        df = df_metiers.dropna(subset=["Poste"]).astype(str)
+        df = df[~df["Poste"].str.lower().duplicated()].reset_index(drop=True)
+        self.titles = df["Poste"].tolist()
+        self.metiers = df["Metiers"].unique().tolist()
+        self.families = df["Famille"].unique().tolist()
+        self.title_codes = {t.lower(): i for i, t in enumerate(self.titles)}
+        metier_codes = {m: i for i, m in enumerate(self.metiers)}
+        family_codes = {f: i for i, f in enumerate(self.families)}
+        self.title_metier = np.array([metier_codes[m] for m in df["Metiers"]], dtype=np.int16)
+        self.title_family = np.array([family_codes[f] for f in df["Famille"]], dtype=np.int16)
+        self.titles_lower = [t.lower() for t in self.titles]
+        if embeddings is None:
+            embeddings = model.encode(self.titles, convert_to_numpy=True)
+            faiss.normalize_L2(embeddings)
+        self.embeddings = embeddings
+
+    def lookup(self, title: str) -> int:
+        """Code exact d'un intitulé (insensible à la casse), NOT_DIGITAL_JOB sinon."""
+        return self.title_codes.get(title.strip().lower(), NOT_DIGITAL_JOB)
+
+    def titles_in_text(self, text_lower: str) -> List[int]:
+        """
+        Codes des intitulés contenus dans le texte (déjà en minuscules), par ordre d'apparition.
+        Un intitulé contenu dans un autre (« développeur » dans « développeur web ») est aussi retenu.
+        """
+        found = [(text_lower.find(t), code) for code, t in enumerate(self.titles_lower)]
+        return [code for position, code in sorted(found) if position >= 0]
+
+    def find_in_text(self, text_lower: str) -> Optional[str]:
+        """Premier intitulé de la cartographie (dans l'ordre de la cartographie) cité dans le texte (déjà en minuscules)."""
+        codes = self.titles_in_text(text_lower)
+        return self.titles_lower[min(codes)] if codes else None
+
+    def classify(self, embeddings: np.ndarray, min_similarity: float = None) -> np.ndarray:
+        """Code de l'intitulé le plus proche pour chaque vecteur normalisé (NOT_DIGITAL_JOB sous le seuil)."""
+        if min_similarity is None:
+            min_similarity = ROLE_MIN_SIMILARITY
+        similarities = np.asarray(embeddings, dtype=np.float32) @ self.embeddings.T
+        best = similarities.argmax(axis=1)
+        best_similarity = similarities[np.arange(len(best)), best]
+        return np.where(best_similarity >= min_similarity, best, NOT_DIGITAL_JOB).astype(np.int16)
+
+    def metier_of(self, title_codes: np.ndarray) -> np.ndarray:
+        """Code métier (niveau 'Metiers') des intitulés, NOT_DIGITAL_JOB si non reconnu."""
+        title_codes = np.asarray(title_codes)
+        return np.where(title_codes >= 0, self.title_metier[np.maximum(title_codes, 0)], NOT_DIGITAL_JOB).astype(np.int16)
+
+def compute_profile_job_codes(stated_titles: List, profile_texts: List, profile_embeddings: np.ndarray):
+    """
+    Codes métier des profils, calculés à l'ingestion :
+    - title_codes : intitulé déclaré (`poste_recherche`) -> code de la cartographie
+      (correspondance exacte, sinon intitulé le plus proche), NOT_DIGITAL_JOB s'il n'est pas
+      un métier du numérique, NO_JOB_TITLE si aucun intitulé n'est déclaré.
+    - role_titles : (n, ROLE_TITLES_PER_PROFILE) codes d'intitulé du profil, complétés par NOT_DIGITAL_JOB :
+      intitulé déclaré, puis intitulés cités tels quels dans full_text (postes occupés).
+      L'intitulé le plus proche du vecteur full_text ne sert que si aucun intitulé n'a été trouvé.
+    """
+    cartography = ml_models.get("job_cartography")
+    stated = [str(t).strip() if isinstance(t, str) and t.strip() else None for t in stated_titles]
+    title_codes = np.full(len(stated), NO_JOB_TITLE, dtype=np.int16)
+    role_titles = np.full((len(stated), ROLE_TITLES_PER_PROFILE), NOT_DIGITAL_JOB, dtype=np.int16)
+    if cartography is None:
+        title_codes[[i for i, t in enumerate(stated) if t]] = NOT_DIGITAL_JOB
+        return title_codes, role_titles
+
+    to_classify = {}
+    for i, title in enumerate(stated):
+        if title:
+            title_codes[i] = cartography.lookup(title)
+            if title_codes[i] == NOT_DIGITAL_JOB:
+                to_classify.setdefault(title, []).append(i)
+    if to_classify:
+        unknown_titles = list(to_classify.keys())
+        title_embeddings = ml_models["model"].encode(unknown_titles, convert_to_numpy=True)
+        faiss.normalize_L2(title_embeddings)
+        for title, code in zip(unknown_titles, cartography.classify(title_embeddings)):
+            title_codes[to_classify[title]] = code
+
+    for i, text in enumerate(profile_texts):
+        codes = [int(title_codes[i])] if title_codes[i] >= 0 else []
+        codes += [code for code in cartography.titles_in_text(str(text).lower()) if code not in codes]
+        codes = codes[:ROLE_TITLES_PER_PROFILE]
+        role_titles[i, :len(codes)] = codes
+    unresolved = role_titles[:, 0] == NOT_DIGITAL_JOB
+    if unresolved.any():
+        role_titles[unresolved, 0] = cartography.classify(profile_embeddings[unresolved])
+    return title_codes, role_titles
+
+def get_profile_row(df_profiles, idx: int):
+    """Retourne un profil (Series ou dict) quel que soit le mode de stockage."""
+    if isinstance(df_profiles, CompactProfileStore):
+        return df_profiles.row(idx)
+    return df_profiles.iloc[idx]
+
+def quantize_embeddings(embeddings: np.ndarray, dtype: str):
+    """
+    Quantifie des embeddings normalisés.
+    - "float16" : simple conversion, pas d'échelle.
+    - "int8" : quantification symétrique par ligne, retourne aussi l'échelle (float32) par profil.
+    """
+    if dtype == "int8":
+        max_abs = np.abs(embeddings).max(axis=1)
+        max_abs[max_abs == 0] = 1.0
+        scale = (max_abs / 127.0).astype(np.float32)
+        quantized = np.round(embeddings / scale[:, None]).astype(np.int8)
+        return quantized, scale
+    if dtype == "float16":
+        return embeddings.astype(np.float16), None
+    return embeddings.astype(np.float32), None
+
+def skills_similarity(offer_skills_emb: np.ndarray, idx: int) -> float:
+    """Produit scalaire offre/profil sur les embeddings de compétences (éventuellement quantifiés)."""
+    state = pool_state()
+    skills_embeddings = state["skills_embeddings"]
+    similarity = float(np.dot(offer_skills_emb[0], skills_embeddings[idx].astype(np.float32)))
+    skills_scale = state.get("skills_scale")
+    if skills_scale is not None:
+        similarity *= float(skills_scale[idx])
+    return similarity
+
+def build_faiss_index(embeddings: np.ndarray, low_memory: Optional[bool] = None, dtype: Optional[str] = None):
+    """
+    Construit l'index FAISS (produit scalaire sur vecteurs normalisés).
+    En mode basse mémoire, les vecteurs de l'index sont stockés en float16/int8 (ScalarQuantizer)
+    au lieu d'une copie float32 complète.
+    `low_memory` / `dtype` : LOW_MEMORY_MODE / EMBEDDINGS_DTYPE par défaut (forcés par bench_memory.py).
+    """
+    low_memory = LOW_MEMORY_MODE if low_memory is None else low_memory
+    dtype = EMBEDDINGS_DTYPE if dtype is None else dtype
+    d = embeddings.shape[1]
+    if low_memory:
+        qtype = faiss.ScalarQuantizer.QT_8bit if dtype == "int8" else faiss.ScalarQuantizer.QT_fp16
+        index = faiss.IndexScalarQuantizer(d, qtype, faiss.METRIC_INNER_PRODUCT)
+        index.train(embeddings)
+    else:
+        index = faiss.IndexFlatIP(d)
+    index.add(embeddings)
+    return index
+
+# --- Chargement des données et des modèles ---
+MODEL_NAME = os.getenv("MODEL_NAME", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+_load_lock = threading.Lock()
+
+def load_sentence_model(name_or_path=MODEL_NAME):
+    # Import différé : sentence_transformers importe torch (plusieurs secondes à froid),
+    # inutile pour les endpoints qui n'encodent rien (/, /jobs)
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(str(name_or_path))
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def load_base_data():
+    """Étapes légères : chemins et cartographie des métiers (pandas uniquement)."""
+    # Résoudre les chemins relatifs par rapport à ce fichier
+    logger.info("Étape 1 : Résolution des chemins de fichiers...")
+    base_dir = Path(__file__).resolve().parent
+    profiles_path = base_dir / "profiles.csv"
+    # Fallback : si le fichier n'existe pas au même niveau, essayer ../profiles.csv (pour endpoint add_profile)
+    if not profiles_path.exists():
+        alt = base_dir.parent / "profiles.csv"
+        if alt.exists():
+            profiles_path = alt
+    logger.info(f"Chemin des profils : {profiles_path}")
+    ml_models["profiles_path"] = profiles_path
+    ml_models["offers_path"] = profiles_path.parent / "offers.csv"
+
+    # Charger la cartographie des métiers du numérique
+    try:
+        logger.info("Étape 3 : Chargement de la cartographie des métiers...")
+        carto_path = base_dir.parent / "data" / "cartographie-metiers-numeriques.csv"
+        df_metiers = pd.read_csv(carto_path, sep=';')
+        ml_models["metiers_digital"] = df_metiers
+        logger.info(f"✅ Cartographie des métiers chargée : {len(df_metiers)} métiers.")
+    except FileNotFoundError:
+        logger.warning("⚠️ Fichier cartographie-metiers-numeriques.csv non trouvé. Fonctionnalité métiers désactivée.")
+        ml_models["metiers_digital"] = pd.DataFrame()
+
+def compute_state(model, profiles_path: Optional[Path] = None) -> Dict:
+    """
+    Étapes coûteuses : encodage des profils, index FAISS, compétences et codes métier.
+    `profiles_path` : fichier de profils d'un vivier nommé (profiles.csv du vivier par défaut sinon).
+    """
+    logger.info("Étape 2 : Chargement du DataFrame des profils...")
+    df_profiles = pd.read_csv(profiles_path or ml_models["profiles_path"])
+    logger.info(f"{len(df_profiles)} profils chargés.")
+
+    logger.info("Étape 5 : Encodage des profils (full_text)...")
+    profile_embeddings = model.encode(df_profiles["full_text"].tolist(), convert_to_numpy=True)
+    logger.info("Encodage des profils terminé.")
+    
+    logger.info("Étape 6 : Normalisation et création de l'index FAISS...")
+    faiss.normalize_L2(profile_embeddings)
+    
+    index = build_faiss_index(profile_embeddings)
+    logger.info("Index FAISS créé.")
+    
+    # Codes métier des profils (filtre numérique et correspondance de rôle par entiers)
+    stated_titles = df_profiles["poste_recherche"].tolist() if "poste_recherche" in df_profiles.columns else [None] * len(df_profiles)
+    title_codes, role_titles = compute_profile_job_codes(stated_titles, df_profiles["full_text"].tolist(), profile_embeddings)
+    
+    # Créer des embeddings séparés pour les compétences et l'expérience
+    logger.info("Étape 7 : Encodage des compétences (hard_skills)...")
+    skills_embeddings = model.encode(df_profiles["hard_skills"].tolist(), convert_to_numpy=True)
+    faiss.normalize_L2(skills_embeddings)
+    logger.info("Encodage des compétences terminé.")
+
+    cartography = ml_models.get("job_cartography")
+    return {
+        "profiles": df_profiles,
+        "faiss_index": index,
+        "skills_embeddings": skills_embeddings,
+        "profile_title_codes": title_codes,
+        "profile_role_titles": role_titles,
+        "title_embeddings": cartography.embeddings if cartography is not None else None,
+    }
+
+def profile_blob_dir() -> Path:
+    """Répertoire des blobs de ce processus (pid évalué à l'appel : correct aussi après un fork)."""
+    return PROFILE_BLOB_DIR / str(os.getpid())
+
+def install_state(state: Dict, target: Optional[Dict] = None, blob_dir: Optional[Path] = None):
+    """Installe l'état calculé (ou lu depuis le snapshot) dans ml_models, ou dans l'état d'un vivier nommé."""
+    target = ml_models if target is None else target
+    blob_dir = profile_blob_dir() if blob_dir is None else blob_dir
+    target["faiss_index"] = state["faiss_index"]
+    target["profile_title_codes"] = state["profile_title_codes"]
+    target["profile_role_titles"] = state["profile_role_titles"]
+
+    skills_embeddings = state["skills_embeddings"]
+    if LOW_MEMORY_MODE:
+        skills_embeddings, skills_scale = quantize_embeddings(skills_embeddings, EMBEDDINGS_DTYPE)
+        target["skills_scale"] = skills_scale
+    target["skills_embeddings"] = skills_embeddings
+
+    # Stockage des profils : DataFrame complet, ou représentation compacte en mode basse mémoire
+    df_profiles = state["profiles"]
+    if LOW_MEMORY_MODE:
+        logger.info("Étape 8 : Construction du stockage compact des profils...")
+        target["profiles"] = CompactProfileStore(df_profiles, blob_dir)
+        logger.info(f"Stockage compact prêt ({EMBEDDINGS_DTYPE}, blob : {blob_dir}).")
+    else:
+        target["profiles"] = df_profiles
+
+def write_state(state: Dict, state_path: Path, profiles_path: Path):
+    """
+    État précalculé (profils, index FAISS sérialisé, embeddings de compétences et des intitulés,
+    codes métier), associé à l'empreinte du fichier de profils dont il est issu (retournée).
+    """
+    profiles_sha256 = file_sha256(profiles_path)
+    payload = dict(state)
+    payload["faiss_index"] = faiss.serialize_index(state["faiss_index"])
+    payload["meta"] = {
+        "model_name": MODEL_NAME,
+        "profiles_sha256": profiles_sha256,
+        "low_memory_mode": LOW_MEMORY_MODE,
+        "embeddings_dtype": EMBEDDINGS_DTYPE,
+        "built_at": time.time(),
+    }
+    Path(state_path).parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = Path(state_path).with_suffix(".tmp")
+    with open(tmp_path, "wb") as f:
+        pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, state_path)
+    return profiles_sha256
+
+def read_state(state_path: Path, profiles_path: Path, profiles_sha256: Optional[str] = None) -> Optional[Dict]:
+    """
+    Lit un état précalculé s'il existe et correspond au modèle et au fichier de profils courants, sinon None.
+    `profiles_sha256` : empreinte attendue, si elle diffère de celle du fichier (vivier avec journal d'ajouts).
+    """
+    state_path = Path(state_path)
+    if not state_path.exists():
+        return None
+    with open(state_path, "rb") as f:
+        payload = pickle.load(f)
+    meta = payload.pop("meta")
+    if meta["model_name"] != MODEL_NAME:
+        logger.warning(f"⚠️ {state_path} ignoré : construit avec le modèle {meta['model_name']}.")
+        return None
+    if meta["profiles_sha256"] != (profiles_sha256 or file_sha256(profiles_path)):
+        logger.warning(f"⚠️ {state_path} ignoré : {Path(profiles_path).name} a changé depuis sa construction.")
+        return None
+    if "profile_role_titles" not in payload:
+        logger.warning(f"⚠️ {state_path} ignoré : rôles des profils dans un format antérieur (codes métier au lieu des intitulés).")
+        return None
+    if meta["low_memory_mode"] != LOW_MEMORY_MODE:
+        logger.warning(f"⚠️ {state_path} construit avec un autre LOW_MEMORY_MODE : index FAISS utilisé tel quel.")
+    payload["faiss_index"] = faiss.deserialize_index(payload["faiss_index"])
+    return payload
+
+def write_snapshot(state: Dict, model, snapshot_path: Path):
+    """Snapshot de déploiement : poids du modèle (model/) et état précalculé du vivier par défaut (state.pkl)."""
+    snapshot_path = Path(snapshot_path)
+    snapshot_path.mkdir(parents=True, exist_ok=True)
+    model.save(str(snapshot_path / "model"))
+    write_state(state, snapshot_path / "state.pkl", ml_models["profiles_path"])
+
+def read_snapshot(snapshot_path: Path) -> Optional[Dict]:
+    """Lit le snapshot s'il existe et correspond au fichier de profils courant, sinon None."""
+    return read_state(Path(snapshot_path) / "state.pkl", ml_models["profiles_path"])
+
+def load_models(with_offers: bool = True):
+    """
+    Charge le modèle, l'index FAISS et les données dérivées : depuis le snapshot de
+    déploiement s'il est valide, sinon en encodant les profils.
+    `with_offers=False` saute le rechargement des offres ouvertes (matching hors ligne).
+    """
+    if "metiers_digital" not in ml_models:
+        load_base_data()
+    timings = {}
+    t0 = time.perf_counter()
+    state = read_snapshot(SNAPSHOT_PATH)
+    timings["snapshot_read"] = time.perf_counter() - t0
+
+    logger.info("Étape 4 : Chargement du modèle SentenceTransformer...")
+    t0 = time.perf_counter()
+    model = load_sentence_model(SNAPSHOT_PATH / "model" if state is not None else MODEL_NAME)
+    ml_models["model"] = model
+    timings["model_load"] = time.perf_counter() - t0
+    logger.info("Modèle SentenceTransformer chargé.")
+    
+    # Cartographie indexée une seule fois (tables de hachage + embeddings des intitulés)
+    t0 = time.perf_counter()
+    ml_models["job_cartography"] = None
+    if not ml_models["metiers_digital"].empty:
+        title_embeddings = state["title_embeddings"] if state is not None else None
+        ml_models["job_cartography"] = JobCartography(ml_models["metiers_digital"], model, embeddings=title_embeddings)
+        logger.info(f"Cartographie indexée : {len(ml_models['job_cartography'].titles)} intitulés.")
+
+    if state is None:
+        state = compute_state(model)
+    else:
+        logger.info(f"Snapshot chargé depuis {SNAPSHOT_PATH}.")
+    install_state(state)
+    timings["index_build"] = time.perf_counter() - t0
+    
+    # Offres ouvertes persistées (matching inverse)
+    if with_offers:
+        logger.info("Étape 9 : Chargement des offres ouvertes...")
+        load_offers()
+        logger.info(f"{len(ml_models['offers'])} offres ouvertes chargées.")
+
+    ml_models["load_timings"] = {k: round(v, 3) for k, v in timings.items()}
+    logger.info(f"✅ Index FAISS construit avec {ml_models['faiss_index'].ntotal} profils ({ml_models['load_timings']}).")
+
+def ensure_base_data():
+    if "metiers_digital" not in ml_models:
+        with _load_lock:
+            if "metiers_digital" not in ml_models:
+                load_base_data()
+
+def ensure_models_loaded(detail: str = "Les modèles ne sont pas encore prêts."):
+    """
+    Vérifie que modèle, index et profils sont chargés. En mode paresseux (LAZY_LOADING=1),
+    les charge à la première requête qui en a besoin ; sinon renvoie une 503.
+    """
+    if "model" in ml_models and "faiss_index" in ml_models and "profiles" in ml_models:
+        return
+    if LAZY_LOADING:
+        with _load_lock:
+            if "faiss_index" not in ml_models:
+                try:
+                    load_models()
+                except Exception as e:
+                    logger.error(f"Erreur lors du chargement des modèles : {e}", exc_info=True)
+        if "model" in ml_models and "faiss_index" in ml_models and "profiles" in ml_models:
+            return
+    raise HTTPException(status_code=503, detail=detail)
+
+# --- Viviers de profils (un par organisation cliente) ---
+# Vivier par défaut : l'état de ml_models (profiles.csv). Vivier nommé : POOLS_DIR/<nom>/profiles.csv,
+# son état calculé (index FAISS, embeddings, codes métier) étant persisté dans POOLS_DIR/<nom>/state.pkl.
+# Les viviers nommés sont chargés à la première requête qui les cible et restent résidents dans la
+# limite de POOL_MEMORY_BUDGET_MB (éviction LRU). Modèle et cartographie sont partagés entre viviers.
+DEFAULT_POOL = "default"
+POOL_NAME_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+pool_registry: "OrderedDict[str, Dict]" = OrderedDict()  # Viviers résidents, du moins au plus récemment utilisé
+pool_stats: Dict[str, Dict] = {}
+_pool_lock = threading.Lock()
+_pool_load_locks: Dict[str, threading.Lock] = {}
+_pool_write_locks: Dict[str, threading.Lock] = {}  # Un verrou d'écriture par vivier (/add_profile, chargement)
+# État du vivier de la requête en cours (renseigné par use_pool), None pour le vivier par défaut
+current_pool: contextvars.ContextVar[Optional[Dict]] = contextvars.ContextVar("current_pool", default=None)
+
+def pool_state() -> Dict:
+    """Profils, index FAISS, embeddings et codes métier du vivier courant (ml_models pour le vivier par défaut)."""
+    state = current_pool.get()
+    return ml_models if state is None else state
+
+def state_nbytes(state: Dict) -> int:
+    """Octets résidents d'un état de matching : profils, embeddings de compétences (et échelles), index FAISS."""
+    profiles = state["profiles"]
+    if isinstance(profiles, CompactProfileStore):
+        total = profiles.nbytes()
+    else:
+        total = int(profiles.memory_usage(deep=True).sum())
+    total += state["skills_embeddings"].nbytes
+    if state.get("skills_scale") is not None:
+        total += state["skills_scale"].nbytes
+    index = state["faiss_index"]
+    total += index.ntotal * index.code_size
+    return total
+
+def new_pool_stats() -> Dict:
+    return {"hits": 0, "misses": 0, "loads": 0, "evictions": 0,
+            "last_load_s": None, "total_load_s": 0.0, "loaded_at": None, "last_used": None}
+
+def pool_profiles_path(name: str) -> Path:
+    if not POOL_NAME_PATTERN.fullmatch(name):
+        raise HTTPException(status_code=400, detail="Nom de vivier invalide (lettres, chiffres, '-' et '_').")
+    profiles_path = POOLS_DIR / name / "profiles.csv"
+    if not profiles_path.exists():
+        raise HTTPException(status_code=404, detail=f"Vivier {name} introuvable.")
+    return profiles_path
+
+def pool_write_lock(name: Optional[str]) -> threading.Lock:
+    """Verrou des écritures d'un vivier : les ajouts de profils de clients différents ne s'attendent pas."""
+    with _pool_lock:
+        return _pool_write_locks.setdefault(name or DEFAULT_POOL, threading.Lock())
+
+def read_pool_journal(journal_path: Path) -> List[Dict]:
+    """Ajouts enregistrés depuis le dernier state.pkl (un enregistrement incomplet en fin de fichier est ignoré)."""
+    records = []
+    if not journal_path.exists():
+        return records
+    with open(journal_path, "rb") as f:
+        while True:
+            try:
+                records.append(pickle.load(f))
+            except (EOFError, pickle.UnpicklingError):
+                return records
+
+def replay_pool_journal(state: Dict, journal: List[Dict], profiles_path: Path) -> bool:
+    """Applique à l'état lu depuis state.pkl les profils ajoutés depuis (profils relus dans profiles.csv)."""
+    df_profiles = pd.read_csv(profiles_path)
+    if len(df_profiles) != state["faiss_index"].ntotal + len(journal):
+        return False
+    state["profiles"] = df_profiles
+    state["faiss_index"].add(np.vstack([r["embedding"] for r in journal]))
+    state["skills_embeddings"] = np.vstack([state["skills_embeddings"]] + [r["skills_embedding"] for r in journal])
+    if all(r["title_codes"] is not None for r in journal):
+        state["profile_title_codes"] = np.concatenate([state["profile_title_codes"]] + [r["title_codes"] for r in journal])
+        state["profile_role_titles"] = np.concatenate([state["profile_role_titles"]] + [r["role_titles"] for r in journal])
+    return True
+
+def load_pool(name: str, profiles_path: Path) -> Dict:
+    """
+    État d'un vivier : state.pkl complété par son journal d'ajouts (state.journal) s'ils correspondent
+    à profiles.csv, sinon calculé puis persisté.
+    """
+    state_path = profiles_path.parent / "state.pkl"
+    journal_path = profiles_path.parent / "state.journal"
+    profiles_sha256 = file_sha256(profiles_path)
+    journal = read_pool_journal(journal_path)
+    if not journal or journal[-1]["profiles_sha256"] != profiles_sha256:
+        journal = []
+    base_sha256 = journal[-1]["base_sha256"] if journal else profiles_sha256
+    state = read_state(state_path, profiles_path, base_sha256)
+    if state is not None and journal and not replay_pool_journal(state, journal, profiles_path):
+        logger.warning(f"⚠️ Vivier {name} : journal d'ajouts incohérent avec profiles.csv.")
+        state = None
+    if state is None:
+        logger.info(f"Vivier {name} : encodage des profils...")
+        state = compute_state(ml_models["model"], profiles_path)
+        base_sha256 = write_state(state, state_path, profiles_path)
+        journal = []
+        journal_path.unlink(missing_ok=True)
+    # Répertoire de blobs propre à chaque chargement : un rechargement après éviction ne réécrit pas
+    # les fichiers encore mappés par les requêtes en cours sur l'ancien état
+    blob_dir = profile_blob_dir() / "pools" / f"{name}-{uuid.uuid4().hex[:8]}"
+    pool = {"name": name, "profiles_path": profiles_path, "blob_dir": blob_dir, "users": 0, "evicted": False,
+            "state_sha256": base_sha256, "journal_size": len(journal)}
+    install_state(state, pool, blob_dir)
+    pool["nbytes"] = state_nbytes(pool)
+    return pool
+
+def record_pool_addition(pool: Dict, df_profiles: pd.DataFrame, added: Dict):
+    """
+    Persiste un profil ajouté par /add_profile (sinon le prochain chargement ré-encoderait tout le vivier) :
+    ses vecteurs sont ajoutés au journal du vivier, sans réécrire state.pkl. Le journal est compacté
+    dans state.pkl quand il dépasse le dixième du vivier (coût amorti constant par ajout).
+    """
+    if pool["journal_size"] + 1 > max(100, len(df_profiles) // 10):
+        save_pool(pool, df_profiles)
+        return
+    record = {**added, "base_sha256": pool["state_sha256"], "profiles_sha256": file_sha256(pool["profiles_path"])}
+    with open(pool["profiles_path"].parent / "state.journal", "ab") as f:
+        pickle.dump(record, f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    pool["journal_size"] += 1
+
+def save_pool(pool: Dict, df_profiles: pd.DataFrame):
+    """
+    Réécrit state.pkl avec l'état courant d'un vivier (compactage du journal d'ajouts).
+    Les embeddings de compétences quantifiés sont re-convertis en float32 : les quantifier
+    à nouveau redonne les mêmes valeurs.
+    """
+    skills_embeddings = pool["skills_embeddings"].astype(np.float32)
+    if pool.get("skills_scale") is not None:
+        skills_embeddings *= pool["skills_scale"][:, None]
+    cartography = ml_models.get("job_cartography")
+    state = {
+        "profiles": df_profiles,
+        "faiss_index": pool["faiss_index"],
+        "skills_embeddings": skills_embeddings,
+        "profile_title_codes": pool["profile_title_codes"],
+        "profile_role_titles": pool["profile_role_titles"],
+        "title_embeddings": cartography.embeddings if cartography is not None else None,
+    }
+    pool["state_sha256"] = write_state(state, pool["profiles_path"].parent / "state.pkl", pool["profiles_path"])
+    (pool["profiles_path"].parent / "state.journal").unlink(missing_ok=True)
+    pool["journal_size"] = 0
+
+def evict_pools(keep: str):
+    """
+    Évince les viviers les moins récemment utilisés tant que la mémoire résidente dépasse le budget.
+    Une requête en cours sur un vivier évincé le conserve jusqu'à sa fin (référence détenue par use_pool) :
+    ses blobs ne sont supprimés qu'une fois la dernière requête terminée (release_pool).
+    """
+    if POOL_MEMORY_BUDGET_MB <= 0:
+        return
+    while sum(p["nbytes"] for p in pool_registry.values()) > POOL_MEMORY_BUDGET_MB * 1e6:
+        oldest = next(iter(pool_registry))
+        if oldest == keep:
+            break  # Vivier demandé seul résident : gardé même s'il dépasse le budget
+        evicted = pool_registry.pop(oldest)
+        evicted["evicted"] = True
+        pool_stats[oldest]["evictions"] += 1
+        if evicted["users"] == 0:
+            shutil.rmtree(evicted["blob_dir"], ignore_errors=True)
+        logger.info(f"Vivier {oldest} évincé (budget mémoire de {POOL_MEMORY_BUDGET_MB:g} Mo).")
+
+def get_pool(name: Optional[str]) -> Optional[Dict]:
+    """
+    État résident du vivier `name`, chargé si besoin (None pour le vivier par défaut).
+    La référence prise sur le vivier est rendue par release_pool.
+    """
+    if not name or name == DEFAULT_POOL:
+        return None
+    profiles_path = pool_profiles_path(name)
+    with _pool_lock:
+        stats = pool_stats.setdefault(name, new_pool_stats())
+        stats["last_used"] = time.time()
+        pool = pool_registry.get(name)
+        if pool is not None:
+            stats["hits"] += 1
+            pool_registry.move_to_end(name)
+            pool["users"] += 1
+            return pool
+        stats["misses"] += 1
+        load_lock = _pool_load_locks.setdefault(name, threading.Lock())
+
+    # Chargement hors du verrou global : les autres viviers restent servis pendant ce temps
+    with load_lock:
+        with _pool_lock:
+            pool = pool_registry.get(name)
+            if pool is not None:
+                pool["users"] += 1
+                return pool
+        t0 = time.perf_counter()
+        # Pas de lecture de profiles.csv / state.journal pendant un ajout au même vivier
+        with pool_write_lock(name):
+            pool = load_pool(name, profiles_path)
+        elapsed = time.perf_counter() - t0
+        record_stage_cost("pool_load", elapsed)
+        with _pool_lock:
+            pool["users"] += 1
+            stats["loads"] += 1
+            stats["last_load_s"] = round(elapsed, 3)
+            stats["total_load_s"] += elapsed
+            stats["loaded_at"] = time.time()
+            pool_registry[name] = pool
+            evict_pools(keep=name)
+    logger.info(f"Vivier {name} chargé en {elapsed:.2f}s ({len(pool['profiles'])} profils, {pool['nbytes'] / 1e6:.1f} Mo).")
+    return pool
+
+def release_pool(pool: Optional[Dict]):
+    """Rend la référence prise par get_pool ; supprime les blobs d'un vivier évincé qui n'est plus utilisé."""
+    if pool is None:
+        return
+    with _pool_lock:
+        pool["users"] -= 1
+        if pool["evicted"] and pool["users"] == 0:
+            shutil.rmtree(pool["blob_dir"], ignore_errors=True)
+
+@contextmanager
+def use_pool(name: Optional[str]):
+    """Matching du bloc sur le vivier `name` (paramètre `pool` de /match, /search, /add_profile)."""
+    ensure_models_loaded()
+    pool = get_pool(name)
+    token = current_pool.set(pool)
+    try:
+        yield
+    finally:
+        current_pool.reset(token)
+        release_pool(pool)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Code exécuté au démarrage de l'application
     logger.info("Chargement des modèles et des données...")
     try:
-        # Résoudre les chemins relatifs par rapport à ce fichier
-        logger.info("Étape 1 : Résolution des chemins de fichiers...")
-        base_dir = Path(__file__).resolve().parent
-        profiles_path = base_dir / "profiles.csv"
-        # Fallback : si le fichier n'existe pas au même niveau, essayer ../profiles.csv (pour endpoint add_profile)
-        if not profiles_path.exists():
-            alt = base_dir.parent / "profiles.csv"
-            if alt.exists():
-                profiles_path = alt
-        logger.info(f"Chemin des profils : {profiles_path}")
-
-        logger.info("Étape 2 : Chargement du DataFrame des profils...")
-        df_profiles = pd.read_csv(profiles_path)
-        ml_models["profiles"] = df_profiles
-        logger.info(f"{len(df_profiles)} profils chargés.")
-        
-        # Charger la cartographie des métiers du numérique
-        try:
-            logger.info("Étape 3 : Chargement de la cartographie des métiers...")
-            carto_path = base_dir.parent / "data" / "cartographie-metiers-numeriques.csv"
-            df_metiers = pd.read_csv(carto_path, sep=';')
-            ml_models["metiers_digital"] = df_metiers
-            logger.info(f"✅ Cartographie des métiers chargée : {len(df_metiers)} métiers.")
-        except FileNotFoundError:
-            logger.warning("⚠️ Fichier cartographie-metiers-numeriques.csv non trouvé. Fonctionnalité métiers désactivée.")
-            ml_models["metiers_digital"] = pd.DataFrame()
-        
-        logger.info("Étape 4 : Chargement du modèle SentenceTransformer...")
-        model = SentenceTransformer("sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
-        ml_models["model"] = model
-        logger.info("Modèle SentenceTransformer chargé.")
-        
-        logger.info("Étape 5 : Encodage des profils (full_text)...")
-        profile_embeddings = model.encode(df_profiles["full_text"].tolist(), convert_to_numpy=True)
-        d = profile_embeddings.shape[1]
-        logger.info("Encodage des profils terminé.")
-        
-        logger.info("Étape 6 : Normalisation et création de l'index FAISS...")
-        faiss.normalize_L2(profile_embeddings)
-        
-        index = faiss.IndexFlatIP(d)
-        index.add(profile_embeddings)
-        ml_models["faiss_index"] = index
-        logger.info("Index FAISS créé.")
-        
-        # Créer des embeddings séparés pour les compétences et l'expérience
-        logger.info("Étape 7 : Encodage des compétences (hard_skills)...")
-        skills_embeddings = model.encode(df_profiles["hard_skills"].tolist(), convert_to_numpy=True)
-        faiss.normalize_L2(skills_embeddings)
-        ml_models["skills_embeddings"] = skills_embeddings
-        logger.info("Encodage des compétences terminé.")
-        
-        logger.info(f"✅ Index FAISS construit avec {index.ntotal} profils.")
-        logger.info("Application démarrée avec succès.")
+        load_base_data()
+        if LAZY_LOADING:
+            logger.info("Chargement paresseux : modèles et index chargés à la première requête qui en a besoin.")
+        else:
+            load_models()
+            logger.info("Application démarrée avec succès.")
     except Exception as e:
         logger.error(f"Erreur lors du chargement des modèles : {e}", exc_info=True)
         # Vous pourriez vouloir arrêter l'application si les modèles ne se chargent pas
@@ -97,6 +873,9 @@ async def lifespan(app: FastAPI):
     # Code exécuté à l'arrêt de l'application
     logger.info("Nettoyage et arrêt de l'application...")
     ml_models.clear()
+    pool_registry.clear()
+    if LOW_MEMORY_MODE:
+        shutil.rmtree(profile_blob_dir(), ignore_errors=True)
     logger.info("Application arrêtée.")
 
 def normalize_skills(skills_text: str) -> List[str]:
@@ -283,17 +1062,19 @@ def generate_explanation(offer_text: str, profile_row: pd.Series,
         experience_match_score=round(exp_score, 2)
     )
 
-def update_faiss_index(new_profile_text: str, new_skills_text: str):
+def update_faiss_index(new_profile_text: str, new_skills_text: str, poste_recherche: Optional[str] = None):
     """
-    Met à jour l'index FAISS avec un nouveau profil.
+    Met à jour l'index FAISS (du vivier courant) avec un nouveau profil.
+    Retourne les vecteurs et codes ajoutés (journal d'ajouts d'un vivier nommé), False en cas d'échec.
     """
     try:
-        if "model" not in ml_models or "faiss_index" not in ml_models:
+        state = pool_state()
+        if "model" not in ml_models or "faiss_index" not in state:
             logger.error("Modèle ou index FAISS non chargé")
             return False
             
         model = ml_models["model"]
-        index = ml_models["faiss_index"]
+        index = state["faiss_index"]
         
         # Encoder le nouveau profil
         new_embedding = model.encode([new_profile_text], convert_to_numpy=True)
@@ -302,15 +1083,28 @@ def update_faiss_index(new_profile_text: str, new_skills_text: str):
         # Ajouter au modèle FAISS
         index.add(new_embedding)
         
+        # Codes métier du nouveau profil
+        title_codes = role_titles = None
+        if "profile_title_codes" in state:
+            title_codes, role_titles = compute_profile_job_codes([poste_recherche], [new_profile_text], new_embedding)
+            state["profile_title_codes"] = np.concatenate([state["profile_title_codes"], title_codes])
+            state["profile_role_titles"] = np.concatenate([state["profile_role_titles"], role_titles])
+        
         # Mettre à jour les embeddings de compétences
         new_skills_embedding = model.encode([new_skills_text], convert_to_numpy=True)
         faiss.normalize_L2(new_skills_embedding)
+        added = {"embedding": new_embedding, "skills_embedding": new_skills_embedding,
+                 "title_codes": title_codes, "role_titles": role_titles}
         
-        if "skills_embeddings" in ml_models:
-            ml_models["skills_embeddings"] = np.vstack([ml_models["skills_embeddings"], new_skills_embedding])
+        if "skills_embeddings" in state:
+            if LOW_MEMORY_MODE:
+                new_skills_embedding, new_scale = quantize_embeddings(new_skills_embedding, EMBEDDINGS_DTYPE)
+                if new_scale is not None:
+                    state["skills_scale"] = np.concatenate([state["skills_scale"], new_scale])
+            state["skills_embeddings"] = np.vstack([state["skills_embeddings"], new_skills_embedding])
         
         logger.info("Nouveau profil ajouté à l'index FAISS")
-        return True
+        return added
     except Exception as e:
         logger.error(f"Erreur lors de la mise à jour de l'index FAISS : {e}")
         return False
@@ -326,6 +1120,67 @@ app.add_middleware(
     allow_headers=["*"],  # Autorise tous les en-têtes
 )
 
+# --- Compression des réponses (négociée via Accept-Encoding) ---
+class BrotliResponder(IdentityResponder):
+    content_encoding = "br"
+
+    def __init__(self, app, minimum_size: int, quality: int = 4):
+        super().__init__(app, minimum_size)
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        compressed = self.compressor.process(body)
+        if not more_body:
+            compressed += self.compressor.finish()
+        return compressed
+
+class CompressionMiddleware(GZipMiddleware):
+    """gzip (Starlette), ou br en priorité si le client l'accepte et que le module brotli est installé."""
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and brotli is not None and "br" in Headers(scope=scope).get("Accept-Encoding", ""):
+            await BrotliResponder(self.app, self.minimum_size)(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+app.add_middleware(CompressionMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
+
+@app.middleware("http")
+async def request_id_middleware(request: Request, call_next):
+    """Identifiant de requête (X-Request-ID, généré si absent) et identifiant de trace de classement (X-Trace-ID)."""
+    request.state.received_at = time.monotonic()
+    request.state.request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+    request.state.trace_id = None
+    request.state.degradation_tier = None
+    request.state.profile_id = None
+    timings = {"stages": {}}
+    token = request_timings.set(timings)
+    try:
+        response = await call_next(request)
+    finally:
+        request_timings.reset(token)
+    response.headers["X-Request-ID"] = request.state.request_id
+    if request.state.degradation_tier:
+        response.headers["X-Degradation-Tier"] = request.state.degradation_tier
+    if request.state.profile_id:
+        response.headers["X-Profile-ID"] = request.state.profile_id
+    if timings["stages"]:
+        record_recent_request(request, timings)
+    if request.state.trace_id:
+        response.headers["X-Trace-ID"] = request.state.trace_id
+    return response
+
+def request_trace_id(http_request: Request, forced: bool = False) -> Optional[str]:
+    """
+    Décide si la requête est tracée (en-tête `X-Debug-Trace: 1`, paramètre `trace=true` ou échantillonnage).
+    L'identifiant de trace est généré par le serveur : un X-Request-ID fourni par le client ne peut pas
+    écraser la trace d'une autre requête.
+    """
+    forced = forced or http_request.headers.get("X-Debug-Trace") == "1"
+    if not should_trace(forced):
+        return None
+    http_request.state.trace_id = uuid.uuid4().hex
+    return http_request.state.trace_id
+
 
 # --- Modèles Pydantic (pour la validation des requêtes) ---
 class MatchRequest(BaseModel):
@@ -344,126 +1199,303 @@ class ProfileResult(BaseModel):
 
 class MatchResponse(BaseModel):
     results: list[ProfileResult]
+    next_cursor: Optional[str] = None  # Curseur de la page suivante (GET /results)
+    degradation_tier: Optional[str] = None  # Niveau de dégradation appliqué (requêtes avec budget de latence)
+
+# --- Réponses allégées : sélection de champs, mode compact, pagination ---
+ranking_cache: "OrderedDict[str, Dict]" = OrderedDict()
+_ranking_cache_lock = threading.Lock()  # /search et /results tournent dans le threadpool
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """Valide le sélecteur `fields=id,score,...` par rapport aux champs de ProfileResult."""
+    if not fields:
+        return None
+    selected = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in selected if f not in ProfileResult.model_fields]
+    if unknown or not selected:
+        raise HTTPException(status_code=400, detail=f"Champs inconnus : {', '.join(unknown)}. Champs disponibles : {', '.join(ProfileResult.model_fields)}.")
+    return selected
+
+def store_ranking(results: List[ProfileResult], fields: Optional[List[str]], compact: bool, page_size: int) -> str:
+    """Met en cache un classement complet (LRU + TTL) et retourne son identifiant."""
+    now = time.monotonic()
+    ranking_id = uuid.uuid4().hex
+    with _ranking_cache_lock:
+        for key in [k for k, v in ranking_cache.items() if now - v["created"] > RANKING_CACHE_TTL]:
+            del ranking_cache[key]
+        ranking_cache[ranking_id] = {"results": results, "fields": fields, "compact": compact, "page_size": page_size, "created": now}
+        while len(ranking_cache) > RANKING_CACHE_SIZE:
+            ranking_cache.popitem(last=False)
+    return ranking_id
+
+def dumps_json(payload) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def result_value(profile: ProfileResult, field: str):
+    value = getattr(profile, field)
+    return value.model_dump() if isinstance(value, BaseModel) else value
+
+def lean_response(results: List[ProfileResult], fields: Optional[List[str]], compact: bool, next_cursor: Optional[str],
+                  degradation_tier: Optional[str] = None) -> Response:
+    """
+    Sérialisation directe (orjson si disponible), sans validation Pydantic de la réponse.
+    Mode compact : format colonnaire {"fields": [...], "rows": [[...], ...]}.
+    """
+    columns = fields or list(ProfileResult.model_fields)
+    if compact:
+        payload = {"fields": columns, "rows": [[result_value(p, c) for c in columns] for p in results]}
+    else:
+        payload = {"results": [{c: result_value(p, c) for c in columns} for p in results]}
+    payload["next_cursor"] = next_cursor
+    if degradation_tier is not None:
+        payload["degradation_tier"] = degradation_tier
+    return Response(content=dumps_json(payload), media_type="application/json")
+
+def paginated_response(results: List[ProfileResult], fields: Optional[List[str]] = None, compact: bool = False,
+                       page_size: Optional[int] = None, offset: int = 0, ranking_id: Optional[str] = None,
+                       degradation_tier: Optional[str] = None):
+    """Découpe un classement en pages ; le classement complet est mis en cache s'il reste des pages."""
+    if page_size is not None and page_size < 1:
+        raise HTTPException(status_code=400, detail="page_size doit être supérieur ou égal à 1.")
+    end = offset + page_size if page_size else len(results)
+    next_cursor = None
+    if end < len(results):
+        if ranking_id is None:
+            ranking_id = store_ranking(results, fields, compact, page_size)
+        next_cursor = f"{ranking_id}:{end}"
+    page = results[offset:end]
+    if fields is None and not compact:
+        return MatchResponse(results=page, next_cursor=next_cursor, degradation_tier=degradation_tier)
+    return lean_response(page, fields, compact, next_cursor, degradation_tier)
+
+def budgeted_response(http_request: Request, budget: Optional[Dict], results: List[ProfileResult],
+                      fields: Optional[List[str]], compact: bool, page_size: Optional[int]):
+    """Réponse /match ou /search, avec le niveau de dégradation (corps et en-tête X-Degradation-Tier) si un budget s'applique."""
+    tier = budget["tier"] if budget is not None else None
+    http_request.state.degradation_tier = tier
+    return paginated_response(results, fields, compact, page_size, degradation_tier=tier)
 
 # --- Fonctions Métier ---
-def match_offer_sync(offer_text: str, top_k: int = 7, with_explanation: bool = True):
+def detect_requirements(text: str, required_skills: List[str]) -> Dict:
+    """Heuristiques simples pour détecter des exigences explicites dans l'offre."""
+    txt = text.lower()
+    # rôle / poste (exemples courants)
+    # Tenter de détecter un intitulé de poste plus précis en utilisant la cartographie des métiers
+    role = None
+    if ml_models.get("job_cartography") is not None:
+        role = ml_models["job_cartography"].find_in_text(txt)
+
+    # Si la cartographie n'a rien trouvé, fallback sur des mots-clés simples
+    if not role:
+        role_keywords = ['dev', 'développeur', 'developer', 'web', 'frontend', 'backend', 'full stack', 'fullstack', 'data', 'engineer']
+        for r in role_keywords:
+            if r in txt:
+                role = r
+                break
+
+    # localisation (heuristique : chercher "à <ville>" ou "@ <ville>")
+    loc = None
+    m = re.search(r"\bà\s+([A-Za-zÀ-ÖØ-öø-ÿ\-']{2,})", text, flags=re.IGNORECASE)
+    if m:
+        loc = m.group(1).strip().lower()
+
+    # diplôme demandé (master, licence, phd, ingénieur...)
+    degree_keywords = ['master', 'licence', 'phd', 'doctorat', 'diplôme', 'ingénieur', "d'ingénieur"]
+    degree = None
+    for d in degree_keywords:
+        if d in txt:
+            degree = d
+            break
+
+    return {
+        'role': role,
+        'location': loc,
+        'degree': degree,
+        'required_skills': required_skills
+    }
+
+def profile_matches_requirements(row: pd.Series, reqs: dict) -> bool:
+    """Retourne True si le profil satisfait (heuristiquement) les exigences détectées dans l'offre."""
+    txt = str(row.get('full_text', '')).lower()
+    # role: accepter une correspondance si le titre du profil ou le champ 'poste_recherche' contient la valeur
+    if reqs['role']:
+        profile_title = str(row.get('poste_recherche', '')).lower()
+        if reqs['role'] not in txt and reqs['role'] not in profile_title:
+            return False
+    # location
+    if reqs['location']:
+        loc_field = str(row.get('localisation', '')).lower()
+        if reqs['location'] not in loc_field and reqs['location'] not in txt:
+            return False
+    # degree
+    if reqs['degree']:
+        dipl = str(row.get('diplomes', '')).lower()
+        if reqs['degree'] not in dipl and reqs['degree'] not in txt:
+            return False
+    # skills: si l'offre demande des skills explicites, vérifier qu'au moins un est présent
+    if reqs.get('required_skills'):
+        skills_ok = False
+        for s in reqs['required_skills']:
+            if s in txt:
+                skills_ok = True
+                break
+        if reqs['required_skills'] and not skills_ok:
+            return False
+
+    return True
+
+# --- Budget de latence : niveaux de dégradation ---
+# Du plus complet au plus dégradé ; chaque niveau inclut les dégradations des précédents :
+# explications omises, pool FAISS réduit (2 x top_k), puis pool minimal (top_k) et un seul
+# encodage (l'embedding de l'offre sert aussi au score compétences, sauf s'il est en cache).
+DEGRADATION_TIERS = ["full", "no_explanation", "reduced_pool", "minimal"]
+SEARCH_K_FACTOR = {
+    "full": SEARCH_POOL_FACTOR,
+    "no_explanation": SEARCH_POOL_FACTOR,
+    "reduced_pool": min(2, SEARCH_POOL_FACTOR),
+    "minimal": 1,
+}
+offer_embedding_cache: "OrderedDict[str, tuple]" = OrderedDict()
+# /search tourne dans le threadpool : cache, coûts et statistiques sont modifiés sous ce verrou
+_budget_lock = threading.Lock()
+# Coût observé de chaque étape (moyenne mobile exponentielle, secondes par unité)
+stage_costs = {"encode": 0.0, "search": 0.0, "score": 0.0, "explain": 0.0}
+# Temps par étape de la requête HTTP en cours (renseigné par request_id_middleware)
+request_timings: contextvars.ContextVar[Optional[Dict]] = contextvars.ContextVar("request_timings", default=None)
+degradation_stats = {
+    "requests": 0,
+    "over_budget": 0,
+    "tiers": {tier: 0 for tier in DEGRADATION_TIERS},
+    "latencies": {tier: deque(maxlen=1000) for tier in DEGRADATION_TIERS},
+}
+
+def record_stage_cost(stage: str, seconds: float, count: int = 1):
+    timings = request_timings.get()
+    if timings is not None:
+        timings["stages"][stage] = timings["stages"].get(stage, 0.0) + seconds
+    if count <= 0 or stage not in stage_costs:
+        return
+    per_unit = seconds / count
+    with _budget_lock:
+        previous = stage_costs[stage]
+        stage_costs[stage] = per_unit if previous == 0.0 else 0.8 * previous + 0.2 * per_unit
+
+def request_budget(http_request: Request) -> Optional[Dict]:
     """
-    Fonction de matching synchrone avec pondération (50% skills + 50% expérience).
+    Budget de latence de la requête (en-tête X-Latency-Budget-Ms, sinon LATENCY_BUDGET_MS),
+    décompté depuis la réception de la requête (attente comprise). None si aucun budget.
     """
-    
-    if "model" not in ml_models or "faiss_index" not in ml_models or "profiles" not in ml_models:
-        raise HTTPException(status_code=503, detail="Les modèles ne sont pas encore prêts. Veuillez réessayer dans quelques instants.")
+    header = http_request.headers.get("X-Latency-Budget-Ms")
+    try:
+        budget_ms = float(header) if header else LATENCY_BUDGET_MS
+    except ValueError:
+        raise HTTPException(status_code=400, detail="X-Latency-Budget-Ms doit être un nombre de millisecondes.")
+    if budget_ms <= 0:
+        return None
+    received_at = getattr(http_request.state, "received_at", time.monotonic())
+    return {"budget_ms": budget_ms, "received_at": received_at, "deadline": received_at + budget_ms / 1000, "tier": "full"}
+
+def remaining_budget(budget: Dict) -> float:
+    return budget["deadline"] - time.monotonic()
+
+def estimated_cost(tier: str, top_k: int, with_explanation: bool, cached: bool) -> float:
+    encodes = 0 if cached else (1 if tier == "minimal" else 2)
+    cost = encodes * stage_costs["encode"] + stage_costs["search"] + top_k * SEARCH_K_FACTOR[tier] * stage_costs["score"]
+    if with_explanation and tier == "full":
+        cost += top_k * stage_costs["explain"]
+    return cost
+
+def choose_tier(budget: Dict, top_k: int, with_explanation: bool, cached: bool) -> str:
+    """Niveau le plus complet dont le coût estimé tient dans le budget restant."""
+    remaining = remaining_budget(budget)
+    for tier in DEGRADATION_TIERS:
+        if estimated_cost(tier, top_k, with_explanation, cached) <= remaining:
+            return tier
+    return DEGRADATION_TIERS[-1]
+
+def degrade(budget: Dict, tier: str):
+    """Passe à un niveau plus dégradé en cours de requête (jamais l'inverse)."""
+    if DEGRADATION_TIERS.index(tier) > DEGRADATION_TIERS.index(budget["tier"]):
+        budget["tier"] = tier
+
+def record_degradation(budget: Dict):
+    tier = budget["tier"]
+    latency = time.monotonic() - budget["received_at"]
+    with _budget_lock:
+        degradation_stats["requests"] += 1
+        degradation_stats["tiers"][tier] += 1
+        degradation_stats["latencies"][tier].append(latency)
+        if remaining_budget(budget) < 0:
+            degradation_stats["over_budget"] += 1
+
+def encode_offer(offer_text: str, skills_text: str, single_encoding: bool = False):
+    """
+    Embeddings normalisés de l'offre et de ses compétences, mis en cache (LRU) par texte d'offre.
+    `single_encoding` (niveau minimal) : hors cache, un seul encodage sert aux deux.
+    """
+    with _budget_lock:
+        cached = offer_embedding_cache.get(offer_text)
+        if cached is not None:
+            offer_embedding_cache.move_to_end(offer_text)
+            return cached
 
     model = ml_models["model"]
-    index = ml_models["faiss_index"]
-    df_profiles = ml_models["profiles"]
-    skills_embeddings = ml_models.get("skills_embeddings")
-    
-    # Get digital job titles for filtering (Suggestion 4)
-    df_metiers = ml_models.get("metiers_digital")
-    digital_job_titles = []
-    if not df_metiers.empty:
-        digital_job_titles = df_metiers["Poste"].astype(str).str.lower().unique().tolist()
+    t0 = time.perf_counter()
+    offer_emb = model.encode([offer_text], convert_to_numpy=True)
+    faiss.normalize_L2(offer_emb)
+    if single_encoding:
+        record_stage_cost("encode", time.perf_counter() - t0)
+        return offer_emb, offer_emb
+    offer_skills_emb = model.encode([skills_text], convert_to_numpy=True)
+    faiss.normalize_L2(offer_skills_emb)
+    record_stage_cost("encode", time.perf_counter() - t0, 2)
 
-    # Extraire les compétences et l'expérience de l'offre
-    required_skills = extract_skills_from_text(offer_text)
+    if OFFER_EMBEDDING_CACHE_SIZE > 0:
+        with _budget_lock:
+            offer_embedding_cache[offer_text] = (offer_emb, offer_skills_emb)
+            while len(offer_embedding_cache) > OFFER_EMBEDDING_CACHE_SIZE:
+                offer_embedding_cache.popitem(last=False)
+    return offer_emb, offer_skills_emb
 
-    # Heuristiques simples pour détecter des exigences explicites dans l'offre
-    def detect_requirements(text: str):
-        txt = text.lower()
-        # rôle / poste (exemples courants)
-        # Tenter de détecter un intitulé de poste plus précis en utilisant la cartographie des métiers
-        role = None
-        if "metiers_digital" in ml_models and not ml_models["metiers_digital"].empty:
-            try:
-                jobs = ml_models["metiers_digital"]["Poste"].astype(str).str.lower().unique().tolist()
-                for j in jobs:
-                    if j in txt:
-                        role = j
-                        break
-            except Exception:
-                role = None
-
-        # Si la cartographie n'a rien trouvé, fallback sur des mots-clés simples
-        if not role:
-            role_keywords = ['dev', 'développeur', 'developer', 'web', 'frontend', 'backend', 'full stack', 'fullstack', 'data', 'engineer']
-            for r in role_keywords:
-                if r in txt:
-                    role = r
-                    break
-
-        # localisation (heuristique : chercher "à <ville>" ou "@ <ville>")
-        loc = None
-        m = re.search(r"\bà\s+([A-Za-zÀ-ÖØ-öø-ÿ\-']{2,})", text, flags=re.IGNORECASE)
-        if m:
-            loc = m.group(1).strip().lower()
-
-        # diplôme demandé (master, licence, phd, ingénieur...)
-        degree_keywords = ['master', 'licence', 'phd', 'doctorat', 'diplôme', 'ingénieur', "d'ingénieur"]
-        degree = None
-        for d in degree_keywords:
-            if d in txt:
-                degree = d
-                break
+def offer_skills_text(offer_text: str, required_skills: List[str]) -> str:
+    """Texte encodé pour le score compétences : compétences détectées, sinon l'offre entière."""
+    return ", ".join(required_skills) if required_skills else offer_text
 
-        return {
-            'role': role,
-            'location': loc,
-            'degree': degree,
-            'required_skills': required_skills
-        }
+def prepare_offer(offer_text: str, offer_emb: Optional[np.ndarray] = None,
+                  offer_skills_emb: Optional[np.ndarray] = None, single_encoding: bool = False) -> Dict:
+    """
+    Analyse une offre une seule fois (exigences, embeddings de l'offre et de ses compétences).
+    Le contexte retourné permet de scorer n'importe quel profil avec score_candidate.
+    Les embeddings (normalisés, forme (1, d)) peuvent être fournis s'ils ont été calculés
+    par lot en amont (matching hors ligne), le modèle n'est alors pas sollicité.
+    Sinon ils sont lus dans le cache des offres ou encodés (voir encode_offer).
+    """
+    t_start = time.perf_counter()
+    encode_time = 0.0
 
-    reqs = detect_requirements(offer_text)
-
-    def profile_matches_requirements(row: pd.Series, reqs: dict) -> bool:
-        """Retourne True si le profil satisfait (heuristiquement) les exigences détectées dans l'offre."""
-        txt = str(row.get('full_text', '')).lower()
-        # role: accepter une correspondance si le titre du profil ou le champ 'poste_recherche' contient la valeur
-        if reqs['role']:
-            profile_title = str(row.get('poste_recherche', '')).lower()
-            if reqs['role'] not in txt and reqs['role'] not in profile_title:
-                return False
-        # location
-        if reqs['location']:
-            loc_field = str(row.get('localisation', '')).lower()
-            if reqs['location'] not in loc_field and reqs['location'] not in txt:
-                return False
-        # degree
-        if reqs['degree']:
-            dipl = str(row.get('diplomes', '')).lower()
-            if reqs['degree'] not in dipl and reqs['degree'] not in txt:
-                return False
-        # skills: si l'offre demande des skills explicites, vérifier qu'au moins un est présent
-        if reqs.get('required_skills'):
-            skills_ok = False
-            for s in reqs['required_skills']:
-                if s in txt:
-                    skills_ok = True
-                    break
-            if reqs['required_skills'] and not skills_ok:
-                return False
-
-        return True
+    # Extraire les compétences et l'expérience de l'offre
+    required_skills = extract_skills_from_text(offer_text)
+    reqs = detect_requirements(offer_text, required_skills)
 
-    
     # Extraire l'expérience requise (recherche de patterns comme "3 ans", "5 années")
     exp_pattern = re.search(r'(\d+)\s*(ans?|années?|years?)', offer_text.lower())
     required_exp = int(exp_pattern.group(1)) if exp_pattern else None  # None si pas précisé
     
-    # Encoder l'offre complète pour le matching global
-    offer_emb = model.encode([offer_text], convert_to_numpy=True)
-    faiss.normalize_L2(offer_emb)
-    
-    # Encoder les compétences de l'offre
-    skills_text = ", ".join(required_skills) if required_skills else offer_text
-    offer_skills_emb = model.encode([skills_text], convert_to_numpy=True)
-    faiss.normalize_L2(offer_skills_emb)
-    
-    # Recherche FAISS élargie pour avoir plus de candidats à scorer
-    search_k = min(top_k * 5, len(df_profiles))  # Chercher plus large pool (5x top_k)
-    distances, indices = index.search(offer_emb, search_k)
-
-    logger.info(f"match_offer_sync: Initial FAISS search found {len(indices[0])} candidates.")
+    # Encoder l'offre complète (matching global) et ses compétences
+    if offer_emb is None or offer_skills_emb is None:
+        t0 = time.perf_counter()
+        offer_emb, offer_skills_emb = encode_offer(offer_text, offer_skills_text(offer_text, required_skills), single_encoding)
+        encode_time = time.perf_counter() - t0
+
+    # Rôle de l'offre : intitulé cité dans le texte (role_title), sinon code métier de l'intitulé le plus proche
+    role_title = role_code = NOT_DIGITAL_JOB
+    cartography = ml_models.get("job_cartography")
+    if cartography is not None:
+        role_title = cartography.lookup(reqs['role']) if reqs['role'] else NOT_DIGITAL_JOB
+        if role_title == NOT_DIGITAL_JOB:
+            role_code = int(cartography.metier_of(cartography.classify(offer_emb))[0])
 
     # Extract specific requirements from offer_text for post-filtering (Suggestion 3)
     offer_text_lower = offer_text.lower()
@@ -482,137 +1514,236 @@ def match_offer_sync(offer_text: str, top_k: int = 7, with_explanation: bool = T
                 loc_required = loc_required.split(',')[0].strip()
             break
 
-    mobil_required_offer = "mobile" in offer_text_lower or "déplacement" in offer_text_lower
-    telework_allowed_offer = "télétravail" in offer_text_lower or "remote" in offer_text_lower
-    immediate_required_offer = "immédiatement" in offer_text_lower or "disponible de suite" in offer_text_lower
+    # Analyse du texte (regex, exigences, code métier), hors encodage
+    record_stage_cost("analyze", time.perf_counter() - t_start - encode_time)
+    return {
+        'offer_text': offer_text,
+        'offer_emb': offer_emb,
+        'offer_skills_emb': offer_skills_emb,
+        'role_title': role_title,
+        'role_code': role_code,
+        'required_skills': required_skills,
+        'reqs': reqs,
+        'required_exp': required_exp,
+        'loc_required': loc_required,
+        'mobil_required_offer': "mobile" in offer_text_lower or "déplacement" in offer_text_lower,
+        'telework_allowed_offer': "télétravail" in offer_text_lower or "remote" in offer_text_lower,
+        'immediate_required_offer': "immédiatement" in offer_text_lower or "disponible de suite" in offer_text_lower,
+    }
 
-    # Calculer des attributs de matching pour chaque profil
-    candidates = []
-    for i, idx in enumerate(indices[0]):
-        row = df_profiles.iloc[idx]
-
-        # Compter combien des compétences requises apparaissent dans le texte du profil
-        txt = str(row.get('full_text', '')).lower()
-        skills_match_count = 0
-        for s in required_skills:
-            if s and s in txt:
-                skills_match_count += 1
-
-        # --- Digital profession filter (Suggestion 4) ---
-        profile_job_title = str(row.get('poste_recherche', '')).lower()
-        # If the profile's stated job title is not in the digital jobs list, skip this profile.
-        if digital_job_titles and profile_job_title and profile_job_title not in digital_job_titles:
-            continue # Skip this profile, it's not a digital profession
-        elif not digital_job_titles and profile_job_title: # If no digital jobs list, but profile has a job title, try to infer
-                skills_match_count += 1
-
-        # role/title match: vérifier titre profil (`poste_recherche`) + texte complet
-        role_match = False
-        if reqs['role']:
-            profile_title = str(row.get('poste_recherche', '')).lower()
-            if reqs['role'] in txt or reqs['role'] in profile_title:
-                role_match = True
-
-        # location match
-        location_match = False
-        if reqs['location']:
-            loc_field = str(row.get('localisation', '')).lower()
-            if reqs['location'] in loc_field or reqs['location'] in txt:
-                location_match = True
-
-        # expérience
-        profile_exp = int(row.get('exp_years', 0))
-
-        # Score compétences (pour information / fallback)
-        if skills_embeddings is not None:
-            try:
-                profile_skills_emb = skills_embeddings[idx].reshape(1, -1)
-                skills_similarity = np.dot(offer_skills_emb, profile_skills_emb.T)[0][0]
-                skills_score = max(0, min(1, skills_similarity))
-            except Exception:
-                skills_score = 0.0
-        else:
+def score_candidate(offer: Dict, df_profiles, idx: int, with_explanation: bool = True) -> Optional[Dict]:
+    """
+    Calcule le score d'un profil pour une offre préparée (pondération 50/50 + bonus/malus).
+    Retourne None si le profil est écarté par le filtre des métiers du numérique.
+    """
+    required_skills = offer['required_skills']
+    reqs = offer['reqs']
+    required_exp = offer['required_exp']
+    loc_required = offer['loc_required']
+
+    row = get_profile_row(df_profiles, idx)
+    state = pool_state()
+
+    # Compter combien des compétences requises apparaissent dans le texte du profil
+    txt = str(row.get('full_text', '')).lower()
+    skills_match_count = 0
+    for s in required_skills:
+        if s and s in txt:
+            skills_match_count += 1
+
+    # --- Digital profession filter (Suggestion 4) ---
+    # Codes calculés à l'ingestion : simple comparaison d'entiers
+    profile_title_code = state["profile_title_codes"][idx]
+    # If the profile's stated job title is not a digital profession, skip this profile.
+    if ml_models.get("job_cartography") is not None and profile_title_code == NOT_DIGITAL_JOB:
+        return None # Skip this profile, it's not a digital profession
+    elif ml_models.get("job_cartography") is None and profile_title_code != NO_JOB_TITLE: # If no digital jobs list, but profile has a job title, try to infer
+            skills_match_count += 1
+
+    # role/title match: l'un des codes métier du profil (niveau 'Metiers') est celui de l'offre,
+    # sinon mots-clés génériques dans le texte du profil
+    role_match = False
+    if offer['role_title'] != NOT_DIGITAL_JOB:
+        # Intitulé cité par l'offre : le profil doit citer le même (intitulé déclaré ou poste occupé)
+        role_match = bool((state["profile_role_titles"][idx] == offer['role_title']).any())
+    elif offer['role_code'] != NOT_DIGITAL_JOB:
+        profile_titles = state["profile_role_titles"][idx]
+        role_match = bool((ml_models["job_cartography"].metier_of(profile_titles) == offer['role_code']).any())
+    elif reqs['role']:
+        role_match = reqs['role'] in txt
+
+    # location match
+    location_match = False
+    if reqs['location']:
+        loc_field = str(row.get('localisation', '')).lower()
+        if reqs['location'] in loc_field or reqs['location'] in txt:
+            location_match = True
+
+    # expérience
+    profile_exp = int(row.get('exp_years', 0))
+
+    # Score compétences (pour information / fallback)
+    if state.get("skills_embeddings") is not None:
+        try:
+            skills_score = max(0, min(1, skills_similarity(offer['offer_skills_emb'], idx)))
+        except Exception:
             skills_score = 0.0
-
-        # Calculer un score d'expérience (toujours, utilisé pour le score final)
-        if required_exp is not None:
-            if profile_exp >= required_exp:
-                # L'expérience est suffisante ou supérieure, le score est élevé
-                # Bonus pour l'expérience supplémentaire, plafonné pour ne pas surpondérer
-                exp_score = min(1.0, 0.8 + (profile_exp - required_exp) * 0.05)
-            else:
-                # L'expérience est inférieure, le score est proportionnel
-                if required_exp > 0:
-                    exp_score = max(0, (profile_exp / required_exp) * 0.7)
-                else:
-                    exp_score = 0
+    else:
+        skills_score = 0.0
+
+    # Calculer un score d'expérience (toujours, utilisé pour le score final)
+    if required_exp is not None:
+        if profile_exp >= required_exp:
+            # L'expérience est suffisante ou supérieure, le score est élevé
+            # Bonus pour l'expérience supplémentaire, plafonné pour ne pas surpondérer
+            exp_score = min(1.0, 0.8 + (profile_exp - required_exp) * 0.05)
         else:
-            # Pas d'exigence, on normalise sur une échelle de 20 ans
-            exp_score = min(1.0, profile_exp / 20)
+            # L'expérience est inférieure, le score est proportionnel
+            if required_exp > 0:
+                exp_score = max(0, (profile_exp / required_exp) * 0.7)
+            else:
+                exp_score = 0
+    else:
+        # Pas d'exigence, on normalise sur une échelle de 20 ans
+        exp_score = min(1.0, profile_exp / 20)
 
-        # Générer l'explication (optionnel)
-        explanation = None
-        if with_explanation:
-            explanation = generate_explanation(offer_text, row, skills_score, exp_score)
+    # Générer l'explication (optionnel)
+    explanation = None
+    if with_explanation:
+        explanation = generate_explanation(offer['offer_text'], row, skills_score, exp_score)
 
-        # Pondération fixe 50% compétences / 50% expérience, comme demandé
-        skills_weight = 0.5
-        exp_weight = 0.5
+    # Pondération fixe 50% compétences / 50% expérience, comme demandé
+    skills_weight = 0.5
+    exp_weight = 0.5
 
-        # Calculer un score de pertinence combiné (compétences + expérience)
-        try:
-            base_score = calculate_weighted_score(skills_score, exp_score, skills_weight=skills_weight, exp_weight=exp_weight)
-        except Exception:
-            base_score = 0.0
-
-        # --- Malus pour les filtres stricts (remplace le post-filtrage) ---
-        malus = 0.0
-        profile_row = df_profiles.iloc[idx]
-
-        # Malus de localisation
-        if loc_required:
-            profile_location_lower = profile_row['localisation'].lower()
-            if loc_required not in profile_location_lower:
-                malus += 0.15 # Malus important si la localisation ne correspond pas
-
-        # Malus de mobilité
-        if mobil_required_offer and profile_row.get('mobilite') == "Pas mobile":
-            malus += 0.1 # Malus si la mobilité est requise mais que le profil n'est pas mobile
-
-        # Malus de télétravail
-        if telework_allowed_offer and profile_row.get('mobilite') != "Ouvert au télétravail":
-            malus += 0.1 # Malus si le télétravail est mentionné mais que le profil n'est pas ouvert
-
-        # Malus de disponibilité
-        if immediate_required_offer and profile_row.get('disponibilite') != "Immédiate":
-            malus += 0.1 # Malus si la disponibilité immédiate est requise
-
-        # Petites primes pour role_match / location_match / nombre de skills matchés
-        bonus = 0.0
-        if role_match:
-            bonus += 0.08
-        if location_match:
-            bonus += 0.04
-        # bonus croissant mais plafonné pour skills_match_count
-        bonus += min(0.03 * skills_match_count, 0.12)
-
-        final_score = max(0.0, min(1.0, base_score + bonus - malus))
-
-        candidates.append({
-            'profile': ProfileResult(
-                id=int(row['id']),
-                score=round(float(final_score), 4),
-                exp_years=profile_exp,
-                hard_skills=row['hard_skills'],
-                localisation=row['localisation'],
-                full_text=row['full_text'],
-                explanation=explanation
-            ),
-            'skills_match_count': skills_match_count,
-            'role_match': role_match,
-            'location_match': location_match,
-            'profile_exp': profile_exp
-        })
+    # Calculer un score de pertinence combiné (compétences + expérience)
+    try:
+        base_score = calculate_weighted_score(skills_score, exp_score, skills_weight=skills_weight, exp_weight=exp_weight)
+    except Exception:
+        base_score = 0.0
+
+    # --- Malus pour les filtres stricts (remplace le post-filtrage) ---
+    # Chaque terme est conservé séparément pour la trace de classement
+    malus_terms = {'location': 0.0, 'mobility': 0.0, 'telework': 0.0, 'availability': 0.0}
+    profile_row = row
+
+    # Malus de localisation
+    if loc_required:
+        profile_location_lower = profile_row['localisation'].lower()
+        if loc_required not in profile_location_lower:
+            malus_terms['location'] = 0.15 # Malus important si la localisation ne correspond pas
+
+    # Malus de mobilité
+    if offer['mobil_required_offer'] and profile_row.get('mobilite') == "Pas mobile":
+        malus_terms['mobility'] = 0.1 # Malus si la mobilité est requise mais que le profil n'est pas mobile
+
+    # Malus de télétravail
+    if offer['telework_allowed_offer'] and profile_row.get('mobilite') != "Ouvert au télétravail":
+        malus_terms['telework'] = 0.1 # Malus si le télétravail est mentionné mais que le profil n'est pas ouvert
+
+    # Malus de disponibilité
+    if offer['immediate_required_offer'] and profile_row.get('disponibilite') != "Immédiate":
+        malus_terms['availability'] = 0.1 # Malus si la disponibilité immédiate est requise
+
+    malus = sum(malus_terms.values())
+
+    # Petites primes pour role_match / location_match / nombre de skills matchés
+    bonus_terms = {'role': 0.0, 'location': 0.0, 'skills': 0.0}
+    if role_match:
+        bonus_terms['role'] = 0.08
+    if location_match:
+        bonus_terms['location'] = 0.04
+    # bonus croissant mais plafonné pour skills_match_count
+    bonus_terms['skills'] = min(0.03 * skills_match_count, 0.12)
+
+    bonus = sum(bonus_terms.values())
+
+    final_score = max(0.0, min(1.0, base_score + bonus - malus))
+
+    return {
+        'profile': ProfileResult(
+            id=int(row['id']),
+            score=round(float(final_score), 4),
+            exp_years=profile_exp,
+            hard_skills=row['hard_skills'],
+            localisation=row['localisation'],
+            full_text=row['full_text'],
+            explanation=explanation
+        ),
+        'skills_match_count': skills_match_count,
+        'role_match': role_match,
+        'location_match': location_match,
+        'profile_exp': profile_exp,
+        'skills_score': float(skills_score),
+        'exp_score': float(exp_score),
+        'base_score': float(base_score),
+        'bonus_terms': bonus_terms,
+        'malus_terms': malus_terms,
+    }
+
+def match_offer_sync(offer_text: str, top_k: int = 7, with_explanation: bool = True, trace_id: Optional[str] = None,
+                     budget: Optional[Dict] = None):
+    """
+    Fonction de matching synchrone avec pondération (50% skills + 50% expérience).
+    Si `trace_id` est fourni, le détail du score de chaque candidat est enregistré
+    pendant le classement et consultable ensuite via GET /traces/{trace_id}.
+    Si `budget` est fourni (voir request_budget), le travail est réduit par niveaux quand le
+    budget restant ne suffit plus ; le niveau appliqué est écrit dans budget["tier"].
+    """
+    
+    ensure_models_loaded("Les modèles ne sont pas encore prêts. Veuillez réessayer dans quelques instants.")
+
+    timings = request_timings.get()
+    if timings is not None:
+        timings["offer_chars"] = len(offer_text)
+        timings["offer_preview"] = offer_text[:120]
+    if budget is not None:
+        budget["tier"] = choose_tier(budget, top_k, with_explanation, offer_text in offer_embedding_cache)
+    offer = prepare_offer(offer_text, single_encoding=budget is not None and budget["tier"] == "minimal")
+    trace = new_trace(trace_id, offer, top_k) if trace_id else None
+    results = rank_offer(offer, top_k, with_explanation, trace=trace, budget=budget)
+    if budget is not None:
+        record_degradation(budget)
+    if trace is not None:
+        if budget is not None:
+            trace['degradation_tier'] = budget['tier']
+        store_trace(trace)
+    return results
+
+def rank_offer(offer: Dict, top_k: int = 7, with_explanation: bool = True, trace: Optional[Dict] = None,
+               budget: Optional[Dict] = None) -> List["ProfileResult"]:
+    """
+    Recherche FAISS puis scoring et classement des candidats pour une offre déjà préparée.
+    Si `trace` est fourni, le détail de chaque candidat y est ajouté au fil du classement.
+    Les explications ne sont générées que pour les top_k profils retenus, si le budget le permet.
+    """
+    state = pool_state()
+    index = state["faiss_index"]
+    df_profiles = state["profiles"]
+    tier = budget["tier"] if budget is not None else "full"
+    
+    # Recherche FAISS élargie pour avoir plus de candidats à scorer
+    search_k = min(top_k * SEARCH_K_FACTOR[tier], len(df_profiles))  # Chercher plus large pool (SEARCH_POOL_FACTOR x top_k)
+    t0 = time.perf_counter()
+    distances, indices = index.search(offer['offer_emb'], search_k)
+    record_stage_cost("search", time.perf_counter() - t0)
+    if trace is not None:
+        trace['search_k'] = search_k
+
+    logger.info(f"match_offer_sync: Initial FAISS search found {len(indices[0])} candidates.")
+
+    # Calculer des attributs de matching pour chaque profil
+    candidates = []
+    t0 = time.perf_counter()
+    for retrieval_rank, (idx, distance) in enumerate(zip(indices[0], distances[0])):
+        candidate = score_candidate(offer, df_profiles, idx, with_explanation=False)
+        if trace is not None:
+            trace['candidates'].append(trace_entry(df_profiles, idx, retrieval_rank, distance, candidate))
+        if candidate is not None:
+            candidate['trace_position'] = retrieval_rank
+            candidate['idx'] = idx
+            candidates.append(candidate)
+    record_stage_cost("score", time.perf_counter() - t0, len(indices[0]))
 
     logger.info(f"match_offer_sync: {len(candidates)} candidates scored before post-matching filters.")
 
@@ -622,8 +1753,338 @@ def match_offer_sync(offer_text: str, top_k: int = 7, with_explanation: bool = T
 
     candidates.sort(key=lambda c: -c.get('profile').score)
 
+    if trace is not None:
+        for final_rank, c in enumerate(candidates):
+            trace['candidates'][c['trace_position']]['final_rank'] = final_rank
+            trace['candidates'][c['trace_position']]['returned'] = final_rank < top_k
+
+    selected = candidates[:top_k]
+
+    # Explications des seuls profils retournés (sans effet sur le score), omises si le budget restant est insuffisant
+    if with_explanation and budget is not None and budget["tier"] == "full" \
+            and remaining_budget(budget) < len(selected) * stage_costs["explain"]:
+        degrade(budget, "no_explanation")
+    if with_explanation and (budget is None or budget["tier"] == "full"):
+        t0 = time.perf_counter()
+        for c in selected:
+            c['profile'].explanation = generate_explanation(
+                offer['offer_text'], get_profile_row(df_profiles, c['idx']), c['skills_score'], c['exp_score'])
+        record_stage_cost("explain", time.perf_counter() - t0, len(selected))
+
     # Retourner les top_k profils
-    return [c['profile'] for c in candidates[:top_k]]
+    return [c['profile'] for c in selected]
+
+
+# --- Trace de classement (debug en production) ---
+trace_store: "OrderedDict[str, Dict]" = OrderedDict()
+_trace_lock = threading.Lock()  # /match, /search et /match_debug écrivent depuis le threadpool
+
+def should_trace(forced: bool = False) -> bool:
+    """Trace forcée (en-tête / paramètre) ou échantillonnée selon TRACE_SAMPLE_RATE."""
+    return forced or (TRACE_SAMPLE_RATE > 0 and random.random() < TRACE_SAMPLE_RATE)
+
+def new_trace(trace_id: str, offer: Dict, top_k: int) -> Dict:
+    return {
+        'trace_id': trace_id,
+        'created': time.time(),
+        'offer_text': offer['offer_text'],
+        'top_k': top_k,
+        'required_exp': offer['required_exp'],
+        'loc_required': offer['loc_required'],
+        'role': offer['reqs']['role'],
+        'role_code': int(offer['role_code']),
+        'required_skills': offer['required_skills'],
+        'candidates': [],
+    }
+
+def trace_entry(df_profiles, idx: int, retrieval_rank: int, distance: float, candidate: Optional[Dict]) -> Dict:
+    """Détail du score d'un candidat, tel que calculé pendant le classement."""
+    entry = {
+        'retrieval_rank': retrieval_rank,
+        'faiss_similarity': round(float(distance), 6),
+    }
+    if candidate is None:
+        entry['profile_id'] = int(get_profile_row(df_profiles, idx)['id'])
+        entry['filtered_out'] = 'not_digital_job'  # Intitulé déclaré hors cartographie des métiers
+        return entry
+    entry.update({
+        'profile_id': candidate['profile'].id,
+        'filtered_out': None,
+        'skills_score': round(candidate['skills_score'], 6),
+        'exp_score': round(candidate['exp_score'], 6),
+        'base_score': round(candidate['base_score'], 6),
+        'skills_match_count': candidate['skills_match_count'],
+        'role_match': candidate['role_match'],
+        'location_match': candidate['location_match'],
+        'bonus': candidate['bonus_terms'],
+        'malus': candidate['malus_terms'],
+        'final_score': candidate['profile'].score,
+        'final_rank': None,
+        'returned': False,
+    })
+    return entry
+
+def store_trace(trace: Dict):
+    with _trace_lock:
+        trace_store[trace['trace_id']] = trace
+        trace_store.move_to_end(trace['trace_id'])
+        while len(trace_store) > TRACE_STORE_SIZE:
+            trace_store.popitem(last=False)
+
+# --- Profilage à la demande et requêtes lentes ---
+profile_store: "OrderedDict[str, Dict]" = OrderedDict()
+recent_requests: deque = deque(maxlen=SLOW_REQUEST_WINDOW)
+_profile_times: deque = deque()
+_profiling_lock = threading.Lock()  # Un seul profilage à la fois
+# profile_store, recent_requests et _profile_times : écrits depuis le threadpool et la boucle d'événements
+_profiling_state_lock = threading.Lock()
+
+def require_admin(http_request: Request):
+    """Accès admin : en-tête X-Admin-Token égal à ADMIN_TOKEN (fonctionnalités désactivées si ADMIN_TOKEN est vide)."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Fonctionnalité admin désactivée (ADMIN_TOKEN non configuré).")
+    if not hmac.compare_digest(http_request.headers.get("X-Admin-Token", ""), ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Jeton admin invalide.")
+
+class RequestProfiler:
+    """
+    Profileur déterministe (sys.setprofile) limité au thread de la requête : temps propre
+    de chaque pile d'appels, exportable en piles repliées (flamegraph.pl, speedscope),
+    et statistiques d'allocation tracemalloc (globales au processus pendant la mesure).
+    """
+    def __init__(self):
+        self.stack: List[str] = []
+        self.self_time_ns: Dict[tuple, int] = {}
+        self.last_ns = 0
+        self.started_tracemalloc = False
+
+    def _charge(self, now_ns: int):
+        if self.stack:
+            key = tuple(self.stack)
+            self.self_time_ns[key] = self.self_time_ns.get(key, 0) + now_ns - self.last_ns
+        self.last_ns = now_ns
+
+    def _profile(self, frame, event, arg):
+        now_ns = time.perf_counter_ns()
+        if event == "call":
+            self._charge(now_ns)
+            code = frame.f_code
+            self.stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+        elif event == "c_call":
+            self._charge(now_ns)
+            self.stack.append(f"{getattr(arg, '__module__', None) or 'builtins'}.{getattr(arg, '__qualname__', repr(arg))}")
+        elif self.stack:  # return, c_return, c_exception
+            self._charge(now_ns)
+            self.stack.pop()
+        self.last_ns = time.perf_counter_ns()  # le temps passé ici n'est pas imputé au code profilé
+
+    def __enter__(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracemalloc = True
+        tracemalloc.reset_peak()
+        self.memory_before = tracemalloc.get_traced_memory()[0]
+        self.t0 = time.perf_counter()
+        self.last_ns = time.perf_counter_ns()
+        sys.setprofile(self._profile)
+        return self
+
+    def __exit__(self, *exc):
+        sys.setprofile(None)
+        self.duration = time.perf_counter() - self.t0
+        current, peak = tracemalloc.get_traced_memory()
+        self.allocations = {
+            "peak_kb": round((peak - self.memory_before) / 1024, 1),
+            "retained_kb": round((current - self.memory_before) / 1024, 1),
+            "top": [
+                {"site": str(stat.traceback), "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+                for stat in tracemalloc.take_snapshot().filter_traces(
+                    [tracemalloc.Filter(False, tracemalloc.__file__)]).statistics("lineno")[:15]
+            ],
+        }
+        if self.started_tracemalloc:
+            tracemalloc.stop()
+        return False
+
+    def folded(self) -> str:
+        """Piles repliées « f1;f2;f3 <microsecondes> », une par ligne."""
+        return "\n".join(f"{';'.join(stack)} {ns // 1000}" for stack, ns in self.self_time_ns.items() if ns >= 1000)
+
+    def top_functions(self, limit: int = 20) -> List[Dict]:
+        own = {}
+        for stack, ns in self.self_time_ns.items():
+            own[stack[-1]] = own.get(stack[-1], 0) + ns
+        ranked = sorted(own.items(), key=lambda item: -item[1])[:limit]
+        return [{"function": name, "self_ms": round(ns / 1e6, 3)} for name, ns in ranked]
+
+def acquire_profiling_slot():
+    """Limite de débit (PROFILE_RATE_LIMIT par PROFILE_RATE_WINDOW secondes) et un seul profilage à la fois."""
+    now = time.monotonic()
+    with _profiling_state_lock:
+        while _profile_times and now - _profile_times[0] > PROFILE_RATE_WINDOW:
+            _profile_times.popleft()
+        if len(_profile_times) >= PROFILE_RATE_LIMIT:
+            raise HTTPException(status_code=429, detail="Limite de profilage atteinte, réessayez plus tard.")
+        if not _profiling_lock.acquire(blocking=False):
+            raise HTTPException(status_code=429, detail="Un profilage est déjà en cours.")
+        _profile_times.append(now)
+
+@contextmanager
+def request_profiler(http_request: Request, requested: bool = False):
+    """
+    Profile le bloc si la requête le demande (`profile=true` ou en-tête `X-Profile: 1`, jeton admin requis).
+    Le profil est conservé sous l'identifiant de la requête (en-tête X-Profile-ID).
+    """
+    if not (requested or http_request.headers.get("X-Profile") == "1"):
+        yield None
+        return
+    require_admin(http_request)
+    acquire_profiling_slot()
+    profiler = RequestProfiler()
+    try:
+        with profiler:
+            yield profiler
+    finally:
+        _profiling_lock.release()
+        store_profile(http_request, profiler)
+
+def store_profile(http_request: Request, profiler: RequestProfiler):
+    request_id = http_request.state.request_id
+    profile = {
+        "request_id": request_id,
+        "path": http_request.url.path,
+        "created": time.time(),
+        "duration_ms": round(getattr(profiler, "duration", 0.0) * 1000, 3),
+        "top_functions": profiler.top_functions(),
+        "allocations": getattr(profiler, "allocations", None),
+        "folded": profiler.folded(),
+    }
+    with _profiling_state_lock:
+        profile_store[request_id] = profile
+        profile_store.move_to_end(request_id)
+        while len(profile_store) > PROFILE_STORE_SIZE:
+            profile_store.popitem(last=False)
+    http_request.state.profile_id = request_id
+
+def record_recent_request(http_request: Request, timings: Dict):
+    """Conserve la durée et le temps par étape des requêtes de matching récentes (GET /slow_requests)."""
+    entry = {
+        "request_id": http_request.state.request_id,
+        "path": http_request.url.path,
+        "created": time.time(),
+        "duration_ms": round((time.monotonic() - http_request.state.received_at) * 1000, 3),
+        "stages_ms": {stage: round(seconds * 1000, 3) for stage, seconds in timings["stages"].items()},
+        "offer_chars": timings.get("offer_chars"),
+        "offer_preview": timings.get("offer_preview"),
+        "degradation_tier": http_request.state.degradation_tier,
+        "profile_id": http_request.state.profile_id,
+    }
+    with _profiling_state_lock:
+        recent_requests.append(entry)
+
+# --- Offres ouvertes (matching inverse) ---
+# /offers et /add_profile tournent dans le threadpool : attribution des ids, index des offres et
+# shortlists sont modifiés sous ce verrou. Une shortlist publiée n'est jamais modifiée en place
+# (remplacée par une nouvelle liste), les lecteurs peuvent donc la parcourir sans verrou.
+_offers_lock = threading.Lock()
+
+def find_profile_index(df_profiles, profile_id: int) -> Optional[int]:
+    """Retourne la position d'un profil (ligne de l'index FAISS) à partir de son id."""
+    if isinstance(df_profiles, CompactProfileStore):
+        ids = df_profiles.column("id")
+    else:
+        ids = df_profiles["id"].to_numpy()
+    positions = np.flatnonzero(ids == profile_id)
+    return int(positions[0]) if len(positions) else None
+
+def save_offers():
+    """Persiste les offres ouvertes (id, texte, top_k) ; les shortlists sont recalculées au démarrage."""
+    with _offers_lock:
+        offers = ml_models.get("offers", {})
+        rows = [{"id": o["id"], "offer_text": o["offer_text"], "top_k": o["top_k"]} for o in offers.values()]
+        pd.DataFrame(rows, columns=["id", "offer_text", "top_k"]).to_csv(ml_models["offers_path"], index=False)
+
+def register_offer(offer_text: str, top_k: int = 7, offer_id: Optional[int] = None) -> Dict:
+    """
+    Enregistre une offre ouverte : contexte préparé (réutilisé pour scorer les futurs profils),
+    vecteur dans l'index des offres et shortlist initiale.
+    """
+    # Encodage et classement hors verrou, id attribué au moment de l'insertion
+    offer = prepare_offer(offer_text)
+    entry = {
+        "offer_text": offer_text,
+        "top_k": top_k,
+        "context": offer,
+        "shortlist": rank_offer(offer, top_k, with_explanation=True),
+    }
+    with _offers_lock:
+        offers = ml_models.setdefault("offers", {})
+        if ml_models.get("offers_index") is None:
+            ml_models["offers_index"] = faiss.IndexIDMap(faiss.IndexFlatIP(ml_models["faiss_index"].d))
+        if offer_id is None:
+            offer_id = max(offers.keys(), default=0) + 1
+        entry["id"] = offer_id
+        offers[offer_id] = entry
+        ml_models["offers_index"].add_with_ids(offer["offer_emb"], np.array([offer_id], dtype=np.int64))
+    return entry
+
+def remove_offer(offer_id: int) -> bool:
+    with _offers_lock:
+        offers = ml_models.get("offers", {})
+        if offer_id not in offers:
+            return False
+        del offers[offer_id]
+        ml_models["offers_index"].remove_ids(np.array([offer_id], dtype=np.int64))
+    return True
+
+def nearest_offers(profile_emb: np.ndarray, k: int) -> List[Dict]:
+    """Offres ouvertes les plus proches d'un vecteur de profil (recherche dans l'index des offres)."""
+    with _offers_lock:
+        offers = ml_models.get("offers")
+        offers_index = ml_models.get("offers_index")
+        if not offers or offers_index is None or offers_index.ntotal == 0:
+            return []
+        _, offer_ids = offers_index.search(profile_emb, min(k, offers_index.ntotal))
+        return [offers[int(offer_id)] for offer_id in offer_ids[0] if offer_id >= 0]
+
+def load_offers():
+    """Charge les offres persistées et recalcule leurs shortlists."""
+    with _offers_lock:
+        ml_models["offers"] = {}
+        ml_models["offers_index"] = None
+    offers_path = ml_models.get("offers_path")
+    if not offers_path or not Path(offers_path).exists():
+        return
+    df_offers = pd.read_csv(offers_path)
+    for _, row in df_offers.iterrows():
+        register_offer(str(row["offer_text"]), int(row["top_k"]), offer_id=int(row["id"]))
+
+def update_offer_shortlists(profile_idx: int) -> List[int]:
+    """
+    Matching inverse incrémental : le vecteur du nouveau profil est cherché dans l'index des offres,
+    puis le profil est inséré dans la shortlist des offres proches s'il y dépasse le dernier classé,
+    sans relancer le matching complet de chaque offre.
+    Retourne les identifiants des offres dont la shortlist a changé.
+    """
+    profile_emb = ml_models["faiss_index"].reconstruct(int(profile_idx)).reshape(1, -1)
+
+    updated = []
+    for entry in nearest_offers(profile_emb, OFFER_FANOUT):
+        candidate = score_candidate(entry["context"], ml_models["profiles"], profile_idx)
+        if candidate is None:
+            continue
+        with _offers_lock:
+            if ml_models["offers"].get(entry["id"]) is not entry:
+                continue  # Offre fermée pendant le scoring
+            shortlist = entry["shortlist"]
+            if len(shortlist) >= entry["top_k"] and candidate["profile"].score <= shortlist[-1].score:
+                continue
+            entry["shortlist"] = sorted(shortlist + [candidate["profile"]], key=lambda p: -p.score)[:entry["top_k"]]
+        updated.append(entry["id"])
+
+    if updated:
+        logger.info(f"Matching inverse : shortlists mises à jour pour les offres {updated}")
+    return updated
 
 # --- Endpoints de l'API ---
 @app.get("/")
@@ -640,13 +2101,9 @@ class MatchRequest(BaseModel):
     Type_de_contrat: str | None = None
     Salaire: str | None = None
     top_k: int = 7
-    
-@app.post("/match", response_model=MatchResponse)
-async def match_endpoint(request: MatchRequest):
-    """
-    Endpoint pour trouver les meilleurs profils correspondant à une offre.
-    Supporte les requêtes en texte libre (offer_text) ou structurées en JSON.
-    """
+
+def build_match_query_text(request: MatchRequest) -> str:
+    """Construit le texte de l'offre à partir du texte libre ou des champs structurés."""
     query_text = request.offer_text
     if not query_text: # If offer_text is not provided, construct it from structured fields
         parts = []
@@ -661,10 +2118,34 @@ async def match_endpoint(request: MatchRequest):
             raise HTTPException(status_code=400, detail="Veuillez fournir une description ou au moins un critère de recherche.")
         
         query_text = ". ".join(parts)
+    return query_text
+    
+@app.post("/match", response_model=MatchResponse)
+def match_endpoint(request: MatchRequest, http_request: Request, fields: str | None = None, compact: bool = False,
+                         page_size: int | None = None, trace: bool = False, profile: bool = False, pool: str | None = None):
+    """
+    Endpoint pour trouver les meilleurs profils correspondant à une offre.
+    Supporte les requêtes en texte libre (offer_text) ou structurées en JSON.
+    Options : `fields=id,score` (sélection de champs), `compact=true` (format colonnaire),
+    `page_size=N` (pagination, pages suivantes via GET /results?cursor=...),
+    `trace=true` (détail du classement consultable par un admin via GET /traces/{X-Trace-ID}).
+    En-tête `X-Latency-Budget-Ms` : budget de latence (niveau appliqué dans X-Degradation-Tier).
+    `profile=true` ou `X-Profile: 1` (admin) : profil de la requête consultable via GET /profiling/{X-Profile-ID}.
+    `pool=<nom>` : recherche dans le vivier de profils du client (vivier par défaut sinon).
+    Endpoint synchrone (threadpool), comme /search : le chargement d'un vivier et le matching
+    ne bloquent pas la boucle d'événements.
+    """
+    query_text = build_match_query_text(request)
+    field_list = parse_fields(fields)
+    budget = request_budget(http_request)
 
     try:
-        results = match_offer_sync(query_text, request.top_k)
-        return MatchResponse(results=results)
+        # Les explications ne sont générées que si elles sont demandées
+        with_explanation = field_list is None or "explanation" in field_list
+        trace_id = request_trace_id(http_request, trace)
+        with use_pool(pool), request_profiler(http_request, profile):
+            results = match_offer_sync(query_text, request.top_k, with_explanation=with_explanation, trace_id=trace_id, budget=budget)
+        return budgeted_response(http_request, budget, results, field_list, compact, page_size)
     except HTTPException as e:
         # Propage l'exception HTTP si les modèles ne sont pas prêts
         raise e
@@ -674,29 +2155,24 @@ async def match_endpoint(request: MatchRequest):
 
 
 @app.post("/match_debug")
-async def match_debug_endpoint(request: MatchRequest):
+def match_debug_endpoint(request: MatchRequest, http_request: Request, pool: str | None = None):
     """
     Endpoint debug: renvoie pour les top_k candidats les métadonnées de tri permettant
     de comprendre pourquoi un profil a été ordonné de cette manière.
+    Un seul passage de classement, avec trace forcée : les valeurs renvoyées (similarité FAISS,
+    scores, bonus, malus) sont celles qui ont réellement produit l'ordre.
     """
     try:
-        # On récupère les mêmes candidats mais sans transformer en ProfileResult
-        if "model" not in ml_models or "faiss_index" not in ml_models or "profiles" not in ml_models:
-            raise HTTPException(status_code=503, detail="Les modèles ne sont pas encore prêts.")
-
-        # Copier une version simplifiée de la logique de match_offer_sync mais en retournant
-        # les métadonnées (skills_match_count, role_match, location_match, profile_exp)
-        model = ml_models["model"]
-        index = ml_models["faiss_index"]
-        df_profiles = ml_models["profiles"]
+        ensure_models_loaded()
 
-        offer_text = request.offer_text
-        top_k = request.top_k
+        query_text = build_match_query_text(request)
+        trace_id = request_trace_id(http_request, forced=True)
+        with use_pool(pool):
+            results = match_offer_sync(query_text, top_k=request.top_k, with_explanation=True, trace_id=trace_id)
 
-        # Reutiliser la fonction de matching existante, mais récupérer les candidats bruts
-        # Pour éviter duplication lourde, appeler match_offer_sync(with_explanation=True) et
-        # reconstruire les métadonnées à partir des explanations et profils retournés.
-        results = match_offer_sync(offer_text, top_k=top_k, with_explanation=True)
+        with _trace_lock:
+            trace = trace_store.get(trace_id, {'candidates': []})
+        breakdown = {e['profile_id']: e for e in trace['candidates'] if e['filtered_out'] is None}
 
         debug_list = []
         for pr in results:
@@ -708,24 +2184,144 @@ async def match_debug_endpoint(request: MatchRequest):
                 'strengths': pr.explanation.strengths if pr.explanation else [],
                 'weaknesses': pr.explanation.weaknesses if pr.explanation else [],
                 'skills_match_score': pr.explanation.skills_match_score if pr.explanation else None,
-                'experience_match_score': pr.explanation.experience_match_score if pr.explanation else None
+                'experience_match_score': pr.explanation.experience_match_score if pr.explanation else None,
+                'score_breakdown': breakdown.get(pr.id)
             })
 
-        return {'debug': debug_list}
+        filtered_out = [e for e in trace['candidates'] if e['filtered_out']]
+        return {'trace_id': trace_id, 'debug': debug_list, 'filtered_out': filtered_out}
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Erreur match_debug: {e}")
         raise HTTPException(status_code=500, detail="Erreur interne lors du debug du matching.")
 
+@app.get("/traces")
+def list_traces(http_request: Request):
+    """Traces de classement conservées, les plus récentes en premier (admin : textes d'offres de tous les clients)."""
+    require_admin(http_request)
+    with _trace_lock:
+        traces = list(trace_store.values())
+    return {"traces": [
+        {"trace_id": t["trace_id"], "created": t["created"], "offer_text": t["offer_text"], "top_k": t["top_k"]}
+        for t in reversed(traces)
+    ]}
+
+@app.get("/traces/{trace_id}")
+def get_trace(trace_id: str, http_request: Request):
+    """Détail du score de chaque candidat (rang de retrieval, similarité, scores, bonus/malus, filtrage) (admin)."""
+    require_admin(http_request)
+    with _trace_lock:
+        trace = trace_store.get(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail=f"Aucune trace {trace_id}.")
+    return trace
+
 # --- Nouveaux Endpoints pour la Recherche --
+@app.get("/degradation")
+def degradation_metrics():
+    """Fréquence de chaque niveau de dégradation, latences par niveau et coûts estimés des étapes."""
+    with _budget_lock:
+        requests = degradation_stats["requests"]
+        over_budget = degradation_stats["over_budget"]
+        counts = dict(degradation_stats["tiers"])
+        all_latencies = {tier: list(degradation_stats["latencies"][tier]) for tier in DEGRADATION_TIERS}
+        costs = dict(stage_costs)
+        cache_size = len(offer_embedding_cache)
+    tiers = {}
+    for tier in DEGRADATION_TIERS:
+        count = counts[tier]
+        latencies = np.array(all_latencies[tier]) * 1000
+        tiers[tier] = {
+            "count": count,
+            "rate": round(count / requests, 4) if requests else 0.0,
+            "p50_ms": round(float(np.percentile(latencies, 50)), 2) if len(latencies) else None,
+            "p99_ms": round(float(np.percentile(latencies, 99)), 2) if len(latencies) else None,
+        }
+    return {
+        "default_budget_ms": LATENCY_BUDGET_MS,
+        "requests": requests,
+        "over_budget": over_budget,
+        "tiers": tiers,
+        "stage_costs_ms": {stage: round(cost * 1000, 3) for stage, cost in costs.items()},
+        "offer_embedding_cache": cache_size,
+    }
+
+@app.get("/pools")
+def list_pools(http_request: Request):
+    """Viviers de profils : résidence, mémoire, temps de chargement et taux de hit (admin, noms des clients)."""
+    require_admin(http_request)
+    with _pool_lock:
+        resident = {name: (p["nbytes"], len(p["profiles"])) for name, p in pool_registry.items()}
+        stats = {name: dict(st) for name, st in pool_stats.items()}
+    names = {path.parent.name for path in POOLS_DIR.glob("*/profiles.csv")} | set(stats)
+    pools = []
+    for name in sorted(names):
+        st = stats.get(name, new_pool_stats())
+        requests = st["hits"] + st["misses"]
+        nbytes, n_profiles = resident.get(name, (None, None))
+        pools.append({
+            "name": name,
+            "resident": name in resident,
+            "resident_mb": round(nbytes / 1e6, 2) if nbytes is not None else None,
+            "profiles": n_profiles,
+            "hit_rate": round(st["hits"] / requests, 4) if requests else None,
+            "avg_load_s": round(st["total_load_s"] / st["loads"], 3) if st["loads"] else None,
+            **{k: v for k, v in st.items() if k != "total_load_s"},
+        })
+    return {
+        "memory_budget_mb": POOL_MEMORY_BUDGET_MB,
+        "resident_mb": round(sum(nbytes for nbytes, _ in resident.values()) / 1e6, 2),
+        "pools": pools,
+    }
+
+@app.get("/profiling")
+def list_profiles(http_request: Request):
+    """Profils de requêtes conservés (admin), les plus récents en premier."""
+    require_admin(http_request)
+    with _profiling_state_lock:
+        profiles = list(profile_store.values())
+    return {"profiles": [
+        {k: p[k] for k in ("request_id", "path", "created", "duration_ms")} for p in reversed(profiles)
+    ]}
+
+@app.get("/profiling/{request_id}")
+def get_profile(request_id: str, http_request: Request):
+    """Fonctions les plus coûteuses, allocations et piles repliées d'une requête profilée (admin)."""
+    require_admin(http_request)
+    with _profiling_state_lock:
+        profile = profile_store.get(request_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail=f"Aucun profil pour la requête {request_id}.")
+    return profile
+
+@app.get("/profiling/{request_id}/folded")
+def get_profile_folded(request_id: str, http_request: Request):
+    """Piles repliées (microsecondes), à passer à flamegraph.pl ou à importer dans speedscope (admin)."""
+    require_admin(http_request)
+    with _profiling_state_lock:
+        profile = profile_store.get(request_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail=f"Aucun profil pour la requête {request_id}.")
+    return Response(content=profile["folded"], media_type="text/plain")
+
+@app.get("/slow_requests")
+def slow_requests(http_request: Request, limit: int = 20):
+    """Requêtes de matching récentes les plus lentes, avec le temps passé dans chaque étape (admin)."""
+    require_admin(http_request)
+    with _profiling_state_lock:
+        recent = list(recent_requests)
+    ranked = sorted(recent, key=lambda r: -r["duration_ms"])[:limit]
+    return {"window": len(recent), "requests": ranked}
+
 @app.get("/jobs")
 def get_jobs():
     """
     Endpoint pour récupérer la liste des intitulés de poste uniques.
     """
     try:
-        # Utiliser les données chargées en mémoire si disponibles
+        # Utiliser les données chargées en mémoire si disponibles (chargement léger, sans modèle)
+        ensure_base_data()
         if "metiers_digital" in ml_models and not ml_models["metiers_digital"].empty:
             df_jobs = ml_models["metiers_digital"]
             return {"jobs": df_jobs["Poste"].unique().tolist()}
@@ -763,12 +2359,16 @@ class NewProfile(BaseModel):
     poste_recherche: str | None = None
 
 @app.post("/search", response_model=MatchResponse)
-def search_profiles(request: SearchRequest, top_k: int = 7):
+def search_profiles(request: SearchRequest, http_request: Request, top_k: int = 7, fields: str | None = None,
+                    compact: bool = False, page_size: int | None = None, trace: bool = False, profile: bool = False,
+                    pool: str | None = None):
     """
     Endpoint pour rechercher des profils avec pondération et explications.
+    Mêmes options que /match : `fields`, `compact`, `page_size`, `trace`, `profile`, `pool`, en-tête `X-Latency-Budget-Ms`.
     """
-    if "model" not in ml_models or "faiss_index" not in ml_models or "profiles" not in ml_models:
-        raise HTTPException(status_code=503, detail="Les modèles ne sont pas encore prêts.")
+    field_list = parse_fields(fields)
+    budget = request_budget(http_request)
+    ensure_models_loaded()
 
     query_text = ""
     if request.description:
@@ -797,70 +2397,198 @@ def search_profiles(request: SearchRequest, top_k: int = 7):
         raise HTTPException(status_code=400, detail="La requête de recherche est vide.")
 
     # Utiliser la fonction de matching améliorée
-    results = match_offer_sync(query_text, top_k, with_explanation=True)
-    return MatchResponse(results=results)
+    with_explanation = field_list is None or "explanation" in field_list
+    trace_id = request_trace_id(http_request, trace)
+    with use_pool(pool), request_profiler(http_request, profile):
+        results = match_offer_sync(query_text, top_k, with_explanation=with_explanation, trace_id=trace_id, budget=budget)
+    return budgeted_response(http_request, budget, results, field_list, compact, page_size)
+
+@app.get("/results", response_model=MatchResponse)
+def results_page(cursor: str):
+    """
+    Page suivante d'un classement /match ou /search, servie depuis le cache (sans relancer le matching).
+    Le format (fields, compact, page_size) est celui de la requête initiale.
+    """
+    ranking_id, _, offset = cursor.partition(":")
+    if not offset.isdigit():
+        raise HTTPException(status_code=400, detail="Curseur invalide.")
+    with _ranking_cache_lock:
+        entry = ranking_cache.get(ranking_id)
+        if entry is not None:
+            ranking_cache.move_to_end(ranking_id)
+    if entry is None or time.monotonic() - entry["created"] > RANKING_CACHE_TTL:
+        raise HTTPException(status_code=404, detail="Curseur expiré ou inconnu. Veuillez relancer la recherche.")
+    return paginated_response(entry["results"], entry["fields"], entry["compact"], entry["page_size"], int(offset), ranking_id)
 
 
 @app.post("/add_profile")
-async def add_profile(profile: NewProfile):
+def add_profile(profile: NewProfile, pool: str | None = None):
     """
     Endpoint pour ajouter un nouveau profil au système.
+    `pool=<nom>` : ajout au vivier de profils du client (vivier par défaut sinon), persisté dans son journal d'ajouts.
+    Les ajouts à un même vivier sont sérialisés (CSV, index FAISS, journal) ; ceux de viviers différents non.
     """
-    try:
-        # Lire le fichier CSV existant
-        df_profiles = pd.read_csv("../profiles.csv")
+    with use_pool(pool), pool_write_lock(pool):
+        try:
+            # Lire le fichier CSV existant (celui chargé au démarrage, pour rester aligné avec l'index FAISS)
+            state = pool_state()
+            profiles_path = state.get("profiles_path", "../profiles.csv")
+            df_profiles = pd.read_csv(profiles_path)
         
-        # Générer un nouvel ID
-        new_id = df_profiles["id"].max() + 1 if not df_profiles.empty else 1
+            # Générer un nouvel ID
+            new_id = df_profiles["id"].max() + 1 if not df_profiles.empty else 1
         
-        # Créer le texte complet pour la recherche sémantique
-        full_text = (
-            f"Expériences: {profile.experiences}. "
-            f"Diplômes: {profile.diplomes}. "
-            f"Certifications: {profile.certifications}. "
-            f"Compétences techniques: {', '.join(profile.hard_skills)}. "
-            f"Compétences comportementales: {', '.join(profile.soft_skills)}. "
-            f"Langues: {', '.join(profile.langues)}. "
-            f"Localisation: {profile.localisation}. "
-            f"Mobilité: {profile.mobilite}. "
-            f"Disponibilité: {profile.disponibilite}."
-        )
+            # Créer le texte complet pour la recherche sémantique
+            full_text = (
+                f"Expériences: {profile.experiences}. "
+                f"Diplômes: {profile.diplomes}. "
+                f"Certifications: {profile.certifications}. "
+                f"Compétences techniques: {', '.join(profile.hard_skills)}. "
+                f"Compétences comportementales: {', '.join(profile.soft_skills)}. "
+                f"Langues: {', '.join(profile.langues)}. "
+                f"Localisation: {profile.localisation}. "
+                f"Mobilité: {profile.mobilite}. "
+                f"Disponibilité: {profile.disponibilite}."
+            )
         
-        # Créer une nouvelle ligne pour le DataFrame
-        new_row = {
-            'id': new_id,
-            'exp_years': profile.exp_years,
-            'diplomes': profile.diplomes,
-            'certifications': profile.certifications,
-            'hard_skills': str(profile.hard_skills),
-            'soft_skills': str(profile.soft_skills),
-            'langues': str(profile.langues),
-            'localisation': profile.localisation,
-            'mobilite': profile.mobilite,
-            'disponibilite': profile.disponibilite,
-            'full_text': full_text
-        }
+            # Créer une nouvelle ligne pour le DataFrame
+            new_row = {
+                'id': new_id,
+                'exp_years': profile.exp_years,
+                'diplomes': profile.diplomes,
+                'certifications': profile.certifications,
+                'hard_skills': str(profile.hard_skills),
+                'soft_skills': str(profile.soft_skills),
+                'langues': str(profile.langues),
+                'localisation': profile.localisation,
+                'mobilite': profile.mobilite,
+                'disponibilite': profile.disponibilite,
+                'full_text': full_text,
+                'poste_recherche': profile.poste_recherche
+            }
         
-        # Ajouter la nouvelle ligne au DataFrame
-        df_profiles = pd.concat([df_profiles, pd.DataFrame([new_row])], ignore_index=True)
+            # Ajouter la nouvelle ligne au DataFrame
+            df_profiles = pd.concat([df_profiles, pd.DataFrame([new_row])], ignore_index=True)
         
-        # Sauvegarder le DataFrame mis à jour
-        df_profiles.to_csv("../profiles.csv", index=False)
+            # Sauvegarder le DataFrame mis à jour
+            df_profiles.to_csv(profiles_path, index=False)
         
-        # Mettre à jour l'index FAISS avec le nouveau profil
-        skills_text = ', '.join(profile.hard_skills)
-        if update_faiss_index(full_text, skills_text):
-            # Mettre à jour le DataFrame en mémoire
-            ml_models["profiles"] = df_profiles
-            logger.info(f"Nouveau profil ajouté avec succès (ID: {new_id})")
-            return {"status": "success", "message": f"Profil ajouté avec succès (ID: {new_id})", "profile_id": int(new_id)}
-        else:
-            logger.warning("Le profil a été ajouté au CSV mais l'index FAISS n'a pas pu être mis à jour")
-            return {"status": "warning", "message": "Profil ajouté, mais l'index de recherche n'a pas pu être mis à jour immédiatement"}
+            # Mettre à jour l'index FAISS avec le nouveau profil
+            skills_text = ', '.join(profile.hard_skills)
+            added = update_faiss_index(full_text, skills_text, profile.poste_recherche)
+            if added:
+                # Mettre à jour les profils en mémoire
+                if isinstance(state.get("profiles"), CompactProfileStore):
+                    state["profiles"].append(new_row)
+                else:
+                    state["profiles"] = df_profiles
+                # Matching inverse : mettre à jour les shortlists des offres ouvertes concernées
+                # (les offres ouvertes portent sur le vivier par défaut)
+                updated_offers = []
+                if state is ml_models:
+                    updated_offers = update_offer_shortlists(len(state["profiles"]) - 1)
+                else:
+                    state["nbytes"] = state_nbytes(state)
+                    record_pool_addition(state, df_profiles, added)
+                logger.info(f"Nouveau profil ajouté avec succès (ID: {new_id})")
+                return {"status": "success", "message": f"Profil ajouté avec succès (ID: {new_id})", "profile_id": int(new_id), "updated_offers": updated_offers}
+            else:
+                logger.warning("Le profil a été ajouté au CSV mais l'index FAISS n'a pas pu être mis à jour")
+                return {"status": "warning", "message": "Profil ajouté, mais l'index de recherche n'a pas pu être mis à jour immédiatement"}
             
-    except Exception as e:
-        logger.error(f"Erreur lors de l'ajout du profil : {e}")
-        raise HTTPException(status_code=500, detail=f"Erreur lors de l'ajout du profil : {str(e)}")
+        except Exception as e:
+            logger.error(f"Erreur lors de l'ajout du profil : {e}")
+            raise HTTPException(status_code=500, detail=f"Erreur lors de l'ajout du profil : {str(e)}")
+
+# --- Matching inverse : offres ouvertes ---
+class OfferResponse(BaseModel):
+    id: int
+    offer_text: str
+    top_k: int
+    results: list[ProfileResult]  # Shortlist maintenue de manière incrémentale
+
+class OfferMatch(BaseModel):
+    offer_id: int
+    offer_text: str
+    score: float
+    explanation: Optional[MatchExplanation] = None
+
+class ProfileMatchesResponse(BaseModel):
+    profile_id: int
+    results: list[OfferMatch]
+
+def offer_response(entry: Dict) -> OfferResponse:
+    return OfferResponse(id=entry["id"], offer_text=entry["offer_text"], top_k=entry["top_k"], results=entry["shortlist"])
+
+@app.post("/offers", response_model=OfferResponse)
+def create_offer(request: MatchRequest):
+    """
+    Enregistre une offre ouverte et calcule sa shortlist initiale.
+    La shortlist est ensuite mise à jour à chaque ajout de profil (/add_profile).
+    """
+    ensure_models_loaded()
+
+    query_text = build_match_query_text(request)
+    entry = register_offer(query_text, request.top_k)
+    save_offers()
+    logger.info(f"Offre ouverte enregistrée (ID: {entry['id']})")
+    return offer_response(entry)
+
+@app.get("/offers")
+def list_offers():
+    """Liste les offres ouvertes."""
+    ensure_models_loaded()
+    with _offers_lock:
+        offers = list(ml_models.get("offers", {}).values())
+    return {"offers": [{"id": o["id"], "offer_text": o["offer_text"], "top_k": o["top_k"]} for o in offers]}
+
+@app.delete("/offers/{offer_id}")
+def delete_offer(offer_id: int):
+    """Ferme une offre : elle n'est plus proposée aux nouveaux profils."""
+    ensure_models_loaded()
+    if not remove_offer(offer_id):
+        raise HTTPException(status_code=404, detail=f"Offre {offer_id} introuvable.")
+    save_offers()
+    return {"status": "success", "message": f"Offre {offer_id} supprimée"}
+
+@app.get("/offers/{offer_id}/matches", response_model=OfferResponse)
+def offer_matches_endpoint(offer_id: int):
+    """Retourne la shortlist précalculée d'une offre ouverte (sans relancer le matching)."""
+    ensure_models_loaded()
+    entry = ml_models.get("offers", {}).get(offer_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail=f"Offre {offer_id} introuvable.")
+    return offer_response(entry)
+
+@app.get("/profiles/{profile_id}/matches", response_model=ProfileMatchesResponse)
+def profile_matches_endpoint(profile_id: int, top_k: int = 7):
+    """
+    Matching inverse : offres ouvertes les plus adaptées à un profil.
+    Le vecteur du profil est cherché dans l'index des offres, puis chaque offre proche
+    est scorée avec la même logique que /match.
+    """
+    ensure_models_loaded()
+
+    df_profiles = ml_models["profiles"]
+    idx = find_profile_index(df_profiles, profile_id)
+    if idx is None:
+        raise HTTPException(status_code=404, detail=f"Profil {profile_id} introuvable.")
+
+    profile_emb = ml_models["faiss_index"].reconstruct(idx).reshape(1, -1)
+
+    results = []
+    for entry in nearest_offers(profile_emb, top_k * 5):
+        candidate = score_candidate(entry["context"], df_profiles, idx)
+        if candidate is None:
+            continue
+        results.append(OfferMatch(
+            offer_id=entry["id"],
+            offer_text=entry["offer_text"],
+            score=candidate["profile"].score,
+            explanation=candidate["profile"].explanation
+        ))
+    results.sort(key=lambda r: -r.score)
+    return ProfileMatchesResponse(profile_id=profile_id, results=results[:top_k])
 
 # --- Pour exécuter l'application localement ---
 # Commande: uvicorn main:app --reload --port 8000
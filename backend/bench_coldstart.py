@@ -0,0 +1,103 @@
+"""
+Mesure du démarrage à froid : point d'entrée serverless (api/index.py, Mangum)
+face au serveur classique (app.py, lifespan complet au démarrage).
+
+Chaque scénario tourne dans un processus Python neuf et mesure :
+- le temps d'import du point d'entrée (et si torch est déjà importé),
+- le démarrage (lifespan) pour app.py,
+- la première requête sur /, /jobs puis /match (et si torch a été importé entre-temps).
+
+Les requêtes passent par Mangum avec un événement API Gateway minimal dans les deux cas.
+
+Usage : python bench_coldstart.py
+"""
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent
+
+SCENARIO = r'''
+import asyncio, json, sys, time
+t0 = time.perf_counter()
+import {module} as entry
+timings = {{"import": time.perf_counter() - t0}}
+torch = {{"after_import": "torch" in sys.modules}}
+
+from mangum import Mangum
+handler = getattr(entry, "handler", None)
+if handler is None:
+    # app.py : lifespan complet exécuté une fois, comme sous uvicorn
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    t0 = time.perf_counter()
+    try:
+        loop.run_until_complete(entry.app.router.lifespan_context(entry.app).__aenter__())
+    except Exception as exc:
+        print(f"lifespan en échec : {{exc!r}}", file=sys.stderr)
+    timings["startup"] = time.perf_counter() - t0
+    handler = Mangum(entry.app, lifespan="off")
+
+class Context:
+    function_name = "bench"
+
+def invoke(method, path, body=None):
+    event = {{
+        "resource": path, "path": path, "httpMethod": method,
+        "headers": {{"content-type": "application/json"}}, "multiValueHeaders": {{}},
+        "queryStringParameters": None, "multiValueQueryStringParameters": None,
+        "requestContext": {{"resourcePath": path, "httpMethod": method, "path": path,
+                            "identity": {{"sourceIp": "127.0.0.1"}}, "stage": "bench"}},
+        "body": json.dumps(body) if body is not None else None, "isBase64Encoded": False,
+    }}
+    t0 = time.perf_counter()
+    response = handler(event, Context())
+    return time.perf_counter() - t0, response["statusCode"]
+
+statuses = {{}}
+for name, method, path, body in [
+    ("root", "GET", "/", None),
+    ("jobs", "GET", "/jobs", None),
+    ("match", "POST", "/match", {{"offer_text": "Développeur Python avec 3 ans d'expérience à Dakar", "top_k": 7}}),
+]:
+    timings[name], statuses[name] = invoke(method, path, body)
+    torch["after_" + name] = "torch" in sys.modules
+print(json.dumps({{"timings": timings, "statuses": statuses, "torch_loaded": torch}}))
+'''
+
+
+def run(label, module, cwd):
+    proc = subprocess.run(
+        [sys.executable, "-c", SCENARIO.format(module=module)],
+        cwd=cwd, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        print(f"{label}: échec\n{proc.stderr[-2000:]}")
+        return None
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    results = {
+        "serverless (api/index.py)": run("serverless", "index", BACKEND_DIR / "api"),
+        "app.py": run("app.py", "app", BACKEND_DIR),
+    }
+    steps = ["import", "startup", "root", "jobs", "match"]
+    print(f"{'':28s}" + "".join(f"{s:>12s}" for s in steps))
+    for label, result in results.items():
+        if result is None:
+            continue
+        cells = []
+        for step in steps:
+            value = result["timings"].get(step)
+            status = result["statuses"].get(step)
+            cell = "-" if value is None else f"{value:.2f}s" + (f" ({status})" if status and status != 200 else "")
+            cells.append(f"{cell:>12s}")
+        print(f"{label:28s}" + "".join(cells))
+        print(f"{'  torch importé':28s}" + "".join(
+            f"{str(result['torch_loaded'].get('after_' + s, '-')):>12s}" for s in steps))
+
+
+if __name__ == "__main__":
+    main()
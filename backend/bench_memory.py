@@ -0,0 +1,236 @@
+"""
+Benchmark mémoire du mode basse mémoire (LOW_MEMORY_MODE).
+
+Mesure les octets résidents par profil (DataFrame + embeddings float32 + IndexFlatIP)
+face à la représentation compacte (CompactProfileStore + embeddings float16/int8 +
+index ScalarQuantizer), ainsi que la parité du pool de retrieval top-k entre l'index
+IndexFlatIP (float32) et les index IndexScalarQuantizer QT_fp16 / QT_8bit construits par
+build_faiss_index, comme en LOW_MEMORY_MODE, et la parité du classement final :
+score_candidate avec les embeddings de compétences float32 face à float16 / int8
+(quantize_embeddings), sur le même pool de retrieval puis de bout en bout (index et
+embeddings quantifiés).
+
+Les profils sont synthétisés en rééchantillonnant profiles.csv ; les embeddings sont
+synthétiques (vecteurs groupés autour de centroïdes, normalisés), générés par blocs
+pour ne jamais matérialiser la matrice float32 complète. La référence IndexFlatIP est
+interrogée bloc par bloc ; les index quantifiés sont entraînés sur le premier bloc
+(CHUNK vecteurs, toute la base si N <= CHUNK) puis complétés bloc par bloc. Les mêmes
+vecteurs servent d'embeddings de compétences ; seuls les profils des pools sont scorés,
+la quantification étant faite ligne par ligne.
+
+Usage : python bench_memory.py --n 1000000
+"""
+import argparse
+import ast
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from api.main import (
+    NO_JOB_TITLE,
+    NOT_DIGITAL_JOB,
+    CompactProfileStore,
+    build_faiss_index,
+    current_pool,
+    prepare_offer,
+    quantize_embeddings,
+    score_candidate,
+    skills_similarity,
+)
+
+CHUNK = 100_000
+
+
+def synth_profiles(source: Path, n: int, seed: int) -> pd.DataFrame:
+    df = pd.read_csv(source)
+    rng = np.random.default_rng(seed)
+    df = df.iloc[rng.integers(0, len(df), size=n)].reset_index(drop=True)
+    df["id"] = np.arange(1, n + 1)
+    return df
+
+
+def embedding_chunk(i: int, n: int, dim: int, centroids: np.ndarray, seed: int) -> np.ndarray:
+    rng = np.random.default_rng((seed, i))
+    size = min(CHUNK, n - i * CHUNK)
+    assign = rng.integers(0, len(centroids), size=size)
+    emb = centroids[assign] + 0.6 * rng.standard_normal((size, dim), dtype=np.float32)
+    emb /= np.linalg.norm(emb, axis=1, keepdims=True)
+    return emb
+
+
+def gather_embeddings(ids: np.ndarray, n: int, dim: int, centroids: np.ndarray, seed: int) -> np.ndarray:
+    """Lignes `ids` de la matrice synthétique, régénérées bloc par bloc."""
+    out = np.empty((len(ids), dim), dtype=np.float32)
+    for i in np.unique(ids // CHUNK):
+        rows = np.flatnonzero(ids // CHUNK == i)
+        out[rows] = embedding_chunk(i, n, dim, centroids, seed)[ids[rows] % CHUNK]
+    return out
+
+
+def merge_top_k(best_scores, best_ids, scores, ids, k):
+    cand_scores = np.concatenate([best_scores, scores], axis=1)
+    cand_ids = np.concatenate([best_ids, ids], axis=1)
+    order = np.argsort(-cand_scores, axis=1, kind="stable")[:, :k]
+    return np.take_along_axis(cand_scores, order, axis=1), np.take_along_axis(cand_ids, order, axis=1)
+
+
+def flat_top_k(queries: np.ndarray, n: int, dim: int, k: int, centroids: np.ndarray, seed: int) -> np.ndarray:
+    """Référence exacte : un IndexFlatIP par bloc (build_faiss_index en mode normal), top-k fusionnés."""
+    best_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+    best_ids = np.zeros((len(queries), k), dtype=np.int64)
+    for i in range((n + CHUNK - 1) // CHUNK):
+        index = build_faiss_index(embedding_chunk(i, n, dim, centroids, seed), low_memory=False)
+        scores, ids = index.search(queries, min(k, index.ntotal))
+        best_scores, best_ids = merge_top_k(best_scores, best_ids, scores, ids + i * CHUNK, k)
+    return best_ids
+
+
+def quantized_top_k(queries: np.ndarray, n: int, dim: int, k: int, centroids: np.ndarray, seed: int, dtype: str):
+    """Index de LOW_MEMORY_MODE (build_faiss_index, IndexScalarQuantizer) sur toute la base."""
+    index = build_faiss_index(embedding_chunk(0, n, dim, centroids, seed), low_memory=True, dtype=dtype)
+    for i in range(1, (n + CHUNK - 1) // CHUNK):
+        index.add(embedding_chunk(i, n, dim, centroids, seed))
+    _, ids = index.search(queries, k)
+    return ids
+
+
+def offer_text(profile: dict) -> str:
+    """Offre en texte libre tirée d'un profil : compétences, expérience et ville."""
+    skills = ", ".join(ast.literal_eval(profile["hard_skills"]))
+    city = profile["localisation"].split(",")[0]
+    return f"Compétences techniques: {skills}. {profile['exp_years']} ans d'expérience. Poste basé à {city}"
+
+
+def ranking_state(profiles: pd.DataFrame, embeddings: np.ndarray, dtype: str) -> dict:
+    """État de matching restreint aux profils des pools, compétences quantifiées comme en LOW_MEMORY_MODE."""
+    skills_embeddings, skills_scale = quantize_embeddings(embeddings, dtype)
+    return {
+        "profiles": profiles,
+        "skills_embeddings": skills_embeddings,
+        "skills_scale": skills_scale,
+        "profile_title_codes": np.full(len(profiles), NO_JOB_TITLE, dtype=np.int16),
+        "profile_role_titles": np.full((len(profiles), 1), NOT_DIGITAL_JOB, dtype=np.int16),
+    }
+
+
+def final_ranking(offer: dict, state: dict, pool: np.ndarray, k: int):
+    """
+    Classement final d'un pool de retrieval (indices locaux), comme rank_offer :
+    score_candidate dans l'ordre du retrieval puis tri stable par score.
+    Retourne les ids retenus, puis les skills_similarity brutes et les scores finaux du pool.
+    """
+    token = current_pool.set(state)
+    try:
+        similarities = np.array([skills_similarity(offer["offer_skills_emb"], idx) for idx in pool])
+        candidates = [score_candidate(offer, state["profiles"], idx, with_explanation=False) for idx in pool]
+    finally:
+        current_pool.reset(token)
+    scores = np.array([c["profile"].score for c in candidates])
+    selected = sorted(candidates, key=lambda c: -c["profile"].score)[:k]
+    return [c["profile"].id for c in selected], similarities, scores
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=1_000_000, help="Nombre de profils synthétiques")
+    parser.add_argument("--dim", type=int, default=384, help="Dimension des embeddings")
+    parser.add_argument("--queries", type=int, default=50, help="Nombre d'offres pour la parité")
+    parser.add_argument("--top-k", type=int, default=35, help="Taille du pool comparé (top_k * 5 par défaut)")
+    parser.add_argument("--final-k", type=int, default=7, help="Profils retournés après scoring (top_k)")
+    parser.add_argument("--profiles", type=Path, default=Path(__file__).resolve().parent / "api" / "profiles.csv")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    n, dim, k = args.n, args.dim, args.top_k
+    rng = np.random.default_rng(args.seed)
+    centroids = rng.standard_normal((1000, dim), dtype=np.float32)
+
+    # --- Profils ---
+    t0 = time.perf_counter()
+    df = synth_profiles(args.profiles, n, args.seed)
+    df_bytes = int(df.memory_usage(deep=True).sum())
+    # Le store (et son blob) est conservé pour relire les profils scorés
+    blob_dir = tempfile.TemporaryDirectory()
+    store = CompactProfileStore(df, Path(blob_dir.name))
+    store_bytes = store.nbytes()
+    blob_bytes = sum(p.stat().st_size for p in Path(blob_dir.name).glob("*.blob"))
+    assert store.row(n - 1)["full_text"] == df.iloc[n - 1]["full_text"]
+    del df
+    print(f"Profils synthétisés et compactés en {time.perf_counter() - t0:.1f}s")
+
+    # --- Parité du retrieval FAISS (float32 régénéré par blocs) ---
+    # Offres : profils existants bruités
+    q_ids = rng.integers(0, n, size=args.queries)
+    queries = gather_embeddings(q_ids, n, dim, centroids, args.seed)
+    queries += 0.3 * rng.standard_normal((args.queries, dim), dtype=np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    t0 = time.perf_counter()
+    results = {"float32": flat_top_k(queries, n, dim, k, centroids, args.seed)}
+    for name in ("float16", "int8"):
+        results[name] = quantized_top_k(queries, n, dim, k, centroids, args.seed, name)
+    print(f"Index FAISS construits et interrogés en {time.perf_counter() - t0:.1f}s")
+
+    # --- Parité du classement final (score_candidate) ---
+    # Seuls les profils présents dans un pool sont relus et quantifiés (indices locaux)
+    t0 = time.perf_counter()
+    pool_ids = np.unique(np.concatenate([ids.ravel() for ids in results.values()]))
+    local = {name: np.searchsorted(pool_ids, ids) for name, ids in results.items()}
+    pool_profiles = pd.DataFrame([store.row(i) for i in pool_ids])
+    pool_embeddings = gather_embeddings(pool_ids, n, dim, centroids, args.seed)
+    states = {name: ranking_state(pool_profiles, pool_embeddings, name) for name in results}
+    offers = [prepare_offer(offer_text(store.row(q)), offer_emb=queries[[j]], offer_skills_emb=queries[[j]])
+              for j, q in enumerate(q_ids)]
+    # ranking[(skills, pool)] : classements par offre ; pool float32 commun, ou pool de l'index de même précision
+    ranking = {}
+    for name in results:
+        for pool_name in {"float32", name}:
+            ranking[name, pool_name] = [final_ranking(offer, states[name], local[pool_name][j], args.final_k)
+                                        for j, offer in enumerate(offers)]
+    print(f"Classements finaux calculés en {time.perf_counter() - t0:.1f}s")
+
+    # --- Rapport ---
+    profile_part_before = df_bytes / n
+    profile_part_after = store_bytes / n
+    before = profile_part_before + 2 * dim * 4  # skills_embeddings float32 + copie dans IndexFlatIP
+    after16 = profile_part_after + dim * 2 + dim * 2  # skills float16 + IndexScalarQuantizer QT_fp16
+    after8 = profile_part_after + (dim + 4) + dim  # skills int8 + échelle + IndexScalarQuantizer QT_8bit
+
+    print(f"\n=== Octets résidents par profil (N={n:,}, d={dim}) ===")
+    print(f"Profils DataFrame (pandas, deep)        : {profile_part_before:8.0f} o")
+    print(f"Profils compacts (codes + offsets)      : {profile_part_after:8.0f} o  (+ {blob_bytes / n:.0f} o/profil en blob mappé)")
+    print(f"Total float32 (DataFrame + 2 x float32) : {before:8.0f} o")
+    print(f"Total compact float16                   : {after16:8.0f} o  (x{before / after16:.1f})")
+    print(f"Total compact int8                      : {after8:8.0f} o  (x{before / after8:.1f})")
+
+    print(f"\n=== Parité du pool de retrieval top-{k} vs IndexFlatIP ({args.queries} offres) ===")
+    for name, qtype in (("float16", "QT_fp16"), ("int8", "QT_8bit")):
+        overlap = np.mean([len(set(a) & set(b)) / k for a, b in zip(results["float32"], results[name])])
+        top1 = np.mean(results["float32"][:, 0] == results[name][:, 0])
+        same = np.mean([(a == b).all() for a, b in zip(results["float32"], results[name])])
+        print(f"{qtype:8s}: recouvrement@{k} = {overlap:.4f} | top-1 identique = {top1:.2%} | ordre identique = {same:.2%}")
+
+    final_k = args.final_k
+    reference = ranking["float32", "float32"]
+    print(f"\n=== Parité du classement final top-{final_k} (score_candidate) vs float32 ({args.queries} offres) ===")
+    for name in ("float16", "int8"):
+        same_pool = ranking[name, "float32"]
+        for label, i in (("skills_similarity", 1), ("score final", 2)):
+            error = np.abs(np.concatenate([a[i] - b[i] for a, b in zip(same_pool, reference)]))
+            print(f"{name:8s}: erreur |{label}| sur {len(error)} paires : moyenne = {error.mean():.2e} | "
+                  f"p99 = {np.quantile(error, 0.99):.2e} | max = {error.max():.2e}")
+        for pool_name, label in (("float32", "même pool float32"), (name, "bout en bout")):
+            got = ranking[name, pool_name]
+            overlap = np.mean([len(set(a[0]) & set(b[0])) / final_k for a, b in zip(got, reference)])
+            top1 = np.mean([a[0][:1] == b[0][:1] for a, b in zip(got, reference)])
+            same = np.mean([a[0] == b[0] for a, b in zip(got, reference)])
+            print(f"          {label:17s} : recouvrement@{final_k} = {overlap:.4f} | top-1 identique = {top1:.2%} | "
+                  f"ordre identique = {same:.2%}")
+    blob_dir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Construit le snapshot de déploiement : poids du modèle SentenceTransformer, embeddings
+des profils et des intitulés de métiers, index FAISS et codes métier, dans un seul
+répertoire chargé tel quel au démarrage (ou à la première requête en serverless).
+
+À exécuter au build (voir Dockerfile), après toute modification de profiles.csv :
+le snapshot est ignoré si profiles.csv ne correspond plus.
+
+Avec --pool, précalcule l'état d'un vivier client (POOLS_DIR/<nom>/state.pkl, sans le modèle)
+pour que son premier chargement n'ait pas à encoder les profils.
+
+Usage : python build_snapshot.py [--output snapshot] [--pool NOM ...]
+"""
+import argparse
+import time
+from pathlib import Path
+
+from api.main import (
+    MODEL_NAME,
+    POOLS_DIR,
+    SNAPSHOT_PATH,
+    JobCartography,
+    compute_state,
+    load_base_data,
+    load_sentence_model,
+    ml_models,
+    write_snapshot,
+    write_state,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", type=Path, default=SNAPSHOT_PATH, help="Répertoire du snapshot")
+    parser.add_argument("--pool", nargs="+", help="Viviers clients à précalculer (au lieu du snapshot)")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    load_base_data()
+    model = load_sentence_model(MODEL_NAME)
+    ml_models["model"] = model
+    ml_models["job_cartography"] = None
+    if not ml_models["metiers_digital"].empty:
+        ml_models["job_cartography"] = JobCartography(ml_models["metiers_digital"], model)
+
+    if args.pool:
+        for name in args.pool:
+            profiles_path = POOLS_DIR / name / "profiles.csv"
+            state = compute_state(model, profiles_path)
+            write_state(state, profiles_path.parent / "state.pkl", profiles_path)
+            # Les ajouts journalisés sont inclus dans le nouvel état
+            (profiles_path.parent / "state.journal").unlink(missing_ok=True)
+            print(f"Vivier {name} : {len(state['profiles'])} profils en {time.perf_counter() - t0:.1f}s")
+        return
+
+    state = compute_state(model)
+    write_snapshot(state, model, args.output)
+
+    size = sum(p.stat().st_size for p in args.output.rglob("*") if p.is_file())
+    print(f"Snapshot écrit dans {args.output} ({size / 1e6:.1f} Mo, {len(state['profiles'])} profils) en {time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
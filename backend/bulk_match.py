@@ -0,0 +1,322 @@
+"""
+Matching hors ligne en masse : shortlist de chaque offre d'un fichier CSV/JSONL contre
+toute la base de profils, sans passer par l'API HTTP.
+
+- Même scoring que POST /match (prepare_offer + rank_offer de api/main.py).
+- Offres lues en flux, encodées par grands lots dans le processus principal.
+- Recherche FAISS et scoring répartis sur un pool de processus qui partagent l'index
+  FAISS et les embeddings de compétences par mapping mémoire. Les profils sont en revanche
+  dépicklés par chaque worker : un DataFrame est copié par worker, un CompactProfileStore
+  (LOW_MEMORY_MODE) ne copie que ses colonnes numériques et re-mappe ses blobs de texte.
+- Une offre invalide (texte vide, champs incorrects) produit un enregistrement d'erreur
+  au lieu d'interrompre le traitement ; elle compte comme traitée pour la reprise.
+- Résultats écrits au fil de l'eau : JSONL (une ligne par offre) ou Parquet
+  (un fichier part-NNNNN.parquet par lot, une ligne par profil retenu).
+- Reprise sur checkpoint (`<sortie>.checkpoint.json`, mis à jour après chaque lot écrit).
+
+Entrée : colonnes/clés `offer_text` (ou les champs structurés de POST /match : Poste,
+Compétences_techniques, ...), `id` et `top_k` optionnels. Le fichier api/offers.csv
+des offres ouvertes est accepté tel quel.
+
+Usage : python bulk_match.py offres.jsonl shortlists.jsonl [--workers 4] [--batch-size 512]
+"""
+import argparse
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import pickle
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import faiss
+import numpy as np
+import pandas as pd
+
+from fastapi import HTTPException
+
+from api import main as engine
+
+WORK_ARRAYS = ["skills_embeddings", "skills_scale", "profile_title_codes", "profile_role_titles"]
+
+
+# --- Lecture des offres (flux) ---
+def is_missing(value) -> bool:
+    return value is None or (isinstance(value, float) and np.isnan(value))
+
+
+def offer_text_of(record: dict) -> str:
+    """Texte de l'offre : texte libre, sinon champs structurés assemblés comme POST /match."""
+    fields = {k: v for k, v in record.items() if k in engine.MatchRequest.model_fields and not is_missing(v)}
+    if isinstance(fields.get("Compétences_techniques"), str):
+        fields["Compétences_techniques"] = [s.strip() for s in fields["Compétences_techniques"].split(",")]
+    return engine.build_match_query_text(engine.MatchRequest(**fields))
+
+
+def iter_offers(path: Path, default_top_k: int, chunk_size: int):
+    """
+    Produit (id, texte, top_k, erreur) sans charger tout le fichier ; l'id par défaut est la position.
+    Pour une offre invalide, le texte est None et l'erreur décrit le problème.
+    """
+    if path.suffix == ".jsonl":
+        def records():
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+    else:
+        def records():
+            for chunk in pd.read_csv(path, chunksize=chunk_size):
+                yield from chunk.to_dict("records")
+
+    for position, record in enumerate(records()):
+        offer_id = record.get("id")
+        top_k = record.get("top_k")
+        offer_id = position if is_missing(offer_id) else int(offer_id)
+        try:
+            yield offer_id, offer_text_of(record), default_top_k if is_missing(top_k) else int(top_k), None
+        except HTTPException as e:
+            yield offer_id, None, None, str(e.detail)
+        except (ValueError, TypeError) as e:  # ValidationError pydantic, top_k non numérique
+            yield offer_id, None, None, str(e)
+
+
+def batches(iterable, size: int):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# --- Index partagé ---
+def export_shared_state(work_dir: Path):
+    """Écrit l'index FAISS, les tableaux et les profils pour un chargement par mapping mémoire dans les workers."""
+    faiss.write_index(engine.ml_models["faiss_index"], str(work_dir / "profiles.faiss"))
+    for name in WORK_ARRAYS:
+        if engine.ml_models.get(name) is not None:
+            np.save(work_dir / f"{name}.npy", np.asarray(engine.ml_models[name]))
+    cartography = engine.ml_models.get("job_cartography")
+    if cartography is not None:
+        np.save(work_dir / "title_embeddings.npy", cartography.embeddings)
+    # DataFrame, ou CompactProfileStore (sérialisé sans ses blobs, re-mappés depuis PROFILE_BLOB_DIR)
+    with open(work_dir / "profiles.pkl", "wb") as f:
+        pickle.dump(engine.ml_models["profiles"], f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def init_worker(work_dir: str):
+    """Installe dans ml_models un état en lecture seule, mappé depuis work_dir (pas de modèle : offres déjà encodées)."""
+    logging.getLogger(engine.__name__).setLevel(logging.WARNING)
+    work_dir = Path(work_dir)
+    engine.load_base_data()
+    engine.ml_models["job_cartography"] = None
+    if (work_dir / "title_embeddings.npy").exists():
+        engine.ml_models["job_cartography"] = engine.JobCartography(
+            engine.ml_models["metiers_digital"], None, embeddings=np.load(work_dir / "title_embeddings.npy")
+        )
+    # IO_FLAG_MMAP_IFC : les codes d'IndexFlat / IndexScalarQuantizer restent dans le fichier mappé,
+    # partagés entre workers (IO_FLAG_MMAP ne mappe que les listes inversées et copierait l'index)
+    engine.ml_models["faiss_index"] = faiss.read_index(str(work_dir / "profiles.faiss"), faiss.IO_FLAG_MMAP_IFC)
+    for name in WORK_ARRAYS:
+        path = work_dir / f"{name}.npy"
+        engine.ml_models[name] = np.load(path, mmap_mode="r") if path.exists() else None
+    with open(work_dir / "profiles.pkl", "rb") as f:
+        engine.ml_models["profiles"] = pickle.load(f)
+
+
+def match_chunk(chunk, with_explanation: bool):
+    """
+    Shortlists d'un lot d'offres encodées : (pid, temps de scoring, [(id, [ProfileResult en dict, ...], None), ...]).
+    Le pid et le temps servent à mesurer le débit réel de chaque worker.
+    """
+    t0 = time.perf_counter()
+    out = []
+    for offer_id, offer_text, top_k, offer_emb, offer_skills_emb in chunk:
+        offer = engine.prepare_offer(offer_text, offer_emb[None, :], offer_skills_emb[None, :])
+        results = engine.rank_offer(offer, top_k, with_explanation)
+        out.append((offer_id, [r.model_dump(exclude_none=True) for r in results], None))
+    return os.getpid(), time.perf_counter() - t0, out
+
+
+def encode_batch(batch):
+    """Encode en un seul appel au modèle les offres et leurs compétences (mêmes textes que prepare_offer)."""
+    model = engine.ml_models["model"]
+    texts = [text for _, text, _, _ in batch]
+    skills_texts = [engine.offer_skills_text(t, engine.extract_skills_from_text(t)) for t in texts]
+    embeddings = model.encode(texts + skills_texts, convert_to_numpy=True, batch_size=64)
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    faiss.normalize_L2(embeddings)
+    n = len(texts)
+    return [(offer_id, text, top_k, embeddings[i], embeddings[n + i]) for i, (offer_id, text, top_k, _) in enumerate(batch)]
+
+
+# --- Sortie incrémentale et checkpoint ---
+class ShortlistWriter:
+    """
+    Écrit les shortlists lot par lot et tient le checkpoint à jour.
+    JSONL : le checkpoint mémorise la taille du fichier, tronqué à la reprise.
+    Parquet : un fichier par lot dans un répertoire, les lots postérieurs au checkpoint sont supprimés.
+    Une offre en erreur donne {"offer_id", "error"} en JSONL, une ligne sans profil avec `error` en Parquet.
+    """
+    def __init__(self, output: Path, resume: bool):
+        self.output = output
+        self.parquet = output.suffix == ".parquet"
+        self.checkpoint_path = output.with_name(output.name + ".checkpoint.json")
+        self.state = {"offers_done": 0, "bytes": 0, "parts": 0}
+        if resume and self.checkpoint_path.exists():
+            self.state = json.loads(self.checkpoint_path.read_text())
+        if self.parquet:
+            if not resume and output.exists():
+                shutil.rmtree(output)
+            output.mkdir(parents=True, exist_ok=True)
+            for part in output.glob("part-*.parquet"):
+                if int(part.stem.split("-")[1]) >= self.state["parts"]:
+                    part.unlink()
+        else:
+            with open(output, "ab" if resume else "wb") as f:
+                f.truncate(self.state["bytes"])
+
+    def parquet_schema(self):
+        """Schéma fixe des fichiers Parquet : colonnes et types identiques d'un lot à l'autre, avec ou sans erreur."""
+        import pyarrow as pa
+        types = {int: pa.int64(), float: pa.float64(), str: pa.string()}
+        fields = [("offer_id", pa.int64()), ("rank", pa.int64())]
+        fields += [(name, types[f.annotation]) for name, f in engine.ProfileResult.model_fields.items() if f.annotation in types]
+        return pa.schema(fields + [("explanation", pa.string()), ("error", pa.string())])
+
+    def write(self, shortlists):
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            rows = []
+            for offer_id, results, error in shortlists:
+                if error is not None:
+                    rows.append({"offer_id": offer_id, "error": error})
+                    continue
+                rows += [
+                    {"offer_id": offer_id, "rank": rank, **{k: v for k, v in r.items() if k != "explanation"},
+                     **({"explanation": json.dumps(r["explanation"], ensure_ascii=False)} if "explanation" in r else {})}
+                    for rank, r in enumerate(results)
+                ]
+            table = pa.Table.from_pylist(rows, schema=self.parquet_schema())
+            pq.write_table(table, self.output / f"part-{self.state['parts']:05d}.parquet")
+            self.state["parts"] += 1
+        else:
+            with open(self.output, "a", encoding="utf-8") as f:
+                for offer_id, results, error in shortlists:
+                    record = {"offer_id": offer_id, "results": results} if error is None else {"offer_id": offer_id, "error": error}
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+                self.state["bytes"] = f.tell()
+        self.state["offers_done"] += len(shortlists)
+        tmp = self.checkpoint_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.state))
+        os.replace(tmp, self.checkpoint_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", type=Path, help="Offres (.csv ou .jsonl)")
+    parser.add_argument("output", type=Path, help="Shortlists (.jsonl, ou .parquet : répertoire de fichiers par lot)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Processus de scoring")
+    parser.add_argument("--batch-size", type=int, default=512, help="Offres encodées par appel au modèle (et par écriture)")
+    parser.add_argument("--chunk-size", type=int, default=32, help="Offres par tâche envoyée à un worker")
+    parser.add_argument("--top-k", type=int, default=7, help="top_k par défaut si absent de l'entrée")
+    parser.add_argument("--explain", action="store_true", help="Inclure les explications (plus lent)")
+    parser.add_argument("--resume", action="store_true", help="Reprendre après la dernière offre écrite (checkpoint)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger(engine.__name__).setLevel(logging.WARNING)
+    if args.output.suffix == ".parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            parser.error("la sortie Parquet nécessite pyarrow (pip install pyarrow)")
+
+    t0 = time.perf_counter()
+    engine.load_models(with_offers=False)
+    print(f"Modèle et index chargés en {time.perf_counter() - t0:.1f}s ({engine.ml_models['faiss_index'].ntotal} profils)")
+
+    writer = ShortlistWriter(args.output, args.resume)
+    skip = writer.state["offers_done"]
+    if skip:
+        print(f"Reprise : {skip} offres déjà traitées")
+
+    encode_time = 0.0
+    done = 0
+    errors = 0
+    worker_stats = {}  # pid -> [offres scorées, temps de scoring]
+    work_dir = Path(tempfile.mkdtemp(prefix="bulk_match_"))
+    try:
+        export_shared_state(work_dir)
+        ctx = multiprocessing.get_context("spawn")
+        with ctx.Pool(args.workers, initializer=init_worker, initargs=(str(work_dir),)) as pool:
+            # Démarrage des workers hors mesure de débit
+            pool.map(len, [()] * args.workers)
+            t_start = time.perf_counter()
+            score = match_chunk_explain if args.explain else match_chunk_plain
+
+            def flush(pending):
+                nonlocal done, errors
+                batch, result = pending
+                scored = []
+                for pid, seconds, chunk_result in result.get():
+                    stats = worker_stats.setdefault(pid, [0, 0.0])
+                    stats[0] += len(chunk_result)
+                    stats[1] += seconds
+                    scored.extend(chunk_result)
+                # Les offres en erreur reprennent leur place dans l'ordre d'entrée (le checkpoint compte des positions)
+                scored = iter(scored)
+                shortlists = [next(scored) if error is None else (offer_id, None, error) for offer_id, _, _, error in batch]
+                writer.write(shortlists)
+                done += len(shortlists)
+                errors += sum(error is not None for _, _, _, error in batch)
+                print(f"{skip + done} offres traitées ({done / (time.perf_counter() - t_start):.1f} offres/s)")
+
+            # Le lot N est scoré par les workers pendant que le lot N+1 est encodé
+            pending = None
+            offers = itertools.islice(iter_offers(args.input, args.top_k, args.batch_size), skip, None)
+            for batch in batches(offers, args.batch_size):
+                valid = [offer for offer in batch if offer[3] is None]
+                t_encode = time.perf_counter()
+                encoded = encode_batch(valid) if valid else []
+                encode_time += time.perf_counter() - t_encode
+                if pending is not None:
+                    flush(pending)
+                chunks = [encoded[i:i + args.chunk_size] for i in range(0, len(encoded), args.chunk_size)]
+                pending = (batch, pool.map_async(score, chunks))
+            if pending is not None:
+                flush(pending)
+        elapsed = time.perf_counter() - t_start
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"\n=== Débit ({args.workers} workers) ===")
+    print(f"Offres traitées        : {done} (total {skip + done}, dont {errors} en erreur)")
+    print(f"Temps total            : {elapsed:.1f}s (dont encodage {encode_time:.1f}s)")
+    if done and elapsed > 0:
+        print(f"Débit                  : {done / elapsed:.1f} offres/s")
+    # Débit de chaque worker rapporté à son propre temps de scoring (hors attente de l'encodage)
+    for pid, (n, seconds) in sorted(worker_stats.items()):
+        if seconds > 0:
+            print(f"Worker {pid:<15}: {n} offres en {seconds:.1f}s de scoring, {n / seconds:.1f} offres/s")
+
+
+def match_chunk_plain(chunk):
+    return match_chunk(chunk, with_explanation=False)
+
+
+def match_chunk_explain(chunk):
+    return match_chunk(chunk, with_explanation=True)
+
+
+if __name__ == "__main__":
+    main()
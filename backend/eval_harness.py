@@ -0,0 +1,256 @@
+"""
+Harnais d'évaluation qualité / latence du classement (match_offer_sync).
+
+Fixtures (JSONL), une offre par ligne :
+    {"offer_id": "devops-aws", "offer_text": "...", "relevant": [12, 48], "grades": {"12": 2, "48": 1}}
+- `relevant` : identifiants des profils pertinents ;
+- `grades` : pertinence graduée pour le nDCG (optionnel, 1 pour chaque profil pertinent sinon) ;
+- les champs structurés de POST /match (Poste, Compétences_techniques, ...) remplacent `offer_text`.
+
+Chaque configuration est un jeu de variables d'environnement lues par api/main.py
+(SEARCH_POOL_FACTOR, LOW_MEMORY_MODE, EMBEDDINGS_DTYPE, MODEL_NAME, ...), évalué dans un
+processus neuf. Rapport : precision@7, recall@k, nDCG@k, recouvrement du top-k avec la
+première configuration, latence p50/p95 de match_offer_sync (embeddings d'offres non mis en
+cache), mémoire de l'état résident (profils, embeddings, index) et pic RSS du processus.
+
+Usage :
+    python eval_harness.py data/eval_fixtures.jsonl [--configs configs.json] [--k 7] [--repeat 3]
+    python eval_harness.py --make-silver data/eval_fixtures.jsonl
+"""
+import argparse
+import json
+import math
+import os
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+BACKEND_DIR = Path(__file__).resolve().parent
+
+# Configurations comparées par défaut (la première sert de référence pour le recouvrement)
+DEFAULT_CONFIGS = {
+    "reference": {},
+    "pool_x3": {"SEARCH_POOL_FACTOR": "3"},
+    "pool_x2": {"SEARCH_POOL_FACTOR": "2"},
+    "low_memory_fp16": {"LOW_MEMORY_MODE": "1", "EMBEDDINGS_DTYPE": "float16"},
+    "low_memory_int8": {"LOW_MEMORY_MODE": "1", "EMBEDDINGS_DTYPE": "int8"},
+}
+
+# Offres du jeu « silver » : libellés dérivés des attributs des profils (voir silver_label),
+# pas d'une annotation manuelle. Ils servent à comparer les configurations entre elles.
+SILVER_OFFERS = [
+    {"offer_id": "python-ml-5", "offer_text": "Développeur Python Machine Learning avec 5 ans d'expérience, maîtrise de Scikit-learn, Pandas et TensorFlow",
+     "skills": ["Python", "Scikit-learn", "Pandas", "TensorFlow", "PyTorch", "Numpy"], "min_exp": 5,
+     "roles": ["ML Engineer", "Data Scientist", "AI Researcher"]},
+    {"offer_id": "data-scientist-junior", "offer_text": "Data Scientist junior, jusqu'à 3 ans d'expérience : Python, Pandas, Numpy, Data Visualization",
+     "skills": ["Python", "Pandas", "Numpy", "Data Visualization", "Scikit-learn"], "min_exp": 0, "max_exp": 3,
+     "roles": ["Data Scientist", "Data Analyst"]},
+    {"offer_id": "fullstack-react-node", "offer_text": "Développeur Full Stack React / Node.js, 3 ans d'expérience, JavaScript et Docker",
+     "skills": ["React", "Node.js", "JavaScript", "Vue.js", "Angular", "Docker"], "min_exp": 3,
+     "roles": ["Développeur Full Stack", "Développeur Frontend", "Développeur Backend"]},
+    {"offer_id": "devops-aws-3", "offer_text": "Ingénieur DevOps AWS, 3 ans d'expérience, Docker, Kubernetes, Terraform, CI/CD",
+     "skills": ["AWS", "Docker", "Kubernetes", "Ansible", "Linux", "GCP", "Azure"], "min_exp": 3,
+     "roles": ["Ingénieur DevOps", "Ingénieur Cloud", "Administrateur système"]},
+    {"offer_id": "devops-dakar", "offer_text": "Besoin d'un Ingénieur DevOps mobile, disponible immédiatement, avec compétences en Docker et Kubernetes, basé à Dakar, Sénégal",
+     "skills": ["Docker", "Kubernetes", "Ansible", "Linux", "AWS"], "min_exp": 0,
+     "roles": ["Ingénieur DevOps", "Ingénieur Cloud"], "location": "Dakar"},
+    {"offer_id": "ux-senior", "offer_text": "UX Designer senior, 7 ans d'expérience, Figma, prototypage et recherche utilisateur",
+     "skills": ["Figma", "Prototyping", "User Research", "Wireframing", "Adobe XD", "Sketch"], "min_exp": 7,
+     "roles": ["UX Designer", "UI Designer"]},
+    {"offer_id": "agile-pm", "offer_text": "Chef de projet Agile / Scrum Master, 5 ans d'expérience, Scrum, Jira, Trello",
+     "skills": ["Agile", "Scrum", "Jira", "Trello", "Kanban"], "min_exp": 5,
+     "roles": ["Chef de projet", "Scrum Master", "Product Owner", "Directeur de projet"]},
+    {"offer_id": "seo-abidjan", "offer_text": "Expert SEO avec 4 ans d'expérience en marketing digital, ouvert au télétravail depuis Abidjan",
+     "skills": ["SEO", "Keyword Research", "Google Analytics", "Off-Page Optimization", "SEM Rush", "Content Marketing"], "min_exp": 4,
+     "roles": ["Consultant SEO", "Chef de projet SEO", "Traffic Manager"], "location": "Abidjan"},
+    {"offer_id": "cybersec-5", "offer_text": "Analyste cybersécurité, 5 ans d'expérience, tests d'intrusion, SIEM, Wireshark, Metasploit",
+     "skills": ["Penetration Testing", "SIEM", "Wireshark", "Metasploit", "Firewall"], "min_exp": 5,
+     "roles": ["Analyste cybersécurité", "Expert sécurité", "Pen testeur", "Expert Sécurité IT"]},
+    {"offer_id": "data-engineer-paris", "offer_text": "Data Engineer à Paris, 4 ans d'expérience : Spark, Kafka, Hadoop, ETL",
+     "skills": ["Spark", "Kafka", "Hadoop", "ETL Processes", "BigQuery", "SQL"], "min_exp": 4,
+     "roles": ["Data Engineer", "Data Architect"], "location": "Paris"},
+]
+
+
+# --- Jeu silver ---
+def silver_label(spec: dict, profile) -> int:
+    """
+    Pertinence (0 = non pertinent) : au moins deux compétences clés et l'expérience dans la fourchette,
+    +1 si un intitulé visé figure dans les expériences, +1 si la localisation demandée correspond.
+    """
+    import ast
+    skills = {s.lower() for s in ast.literal_eval(profile["hard_skills"])}
+    hits = len(skills & {s.lower() for s in spec["skills"]})
+    exp = int(profile["exp_years"])
+    if hits < 2 or exp < spec.get("min_exp", 0) or exp > spec.get("max_exp", 99):
+        return 0
+    experiences = str(profile["full_text"]).split("Diplômes:")[0].lower()
+    grade = 1
+    if any(role.lower() in experiences for role in spec["roles"]):
+        grade += 1
+    if spec.get("location") and spec["location"].lower() in str(profile["localisation"]).lower():
+        grade += 1
+    return grade
+
+
+def make_silver(output: Path):
+    import pandas as pd
+    profiles = pd.read_csv(BACKEND_DIR / "api" / "profiles.csv")
+    with open(output, "w", encoding="utf-8") as f:
+        for spec in SILVER_OFFERS:
+            grades = {int(p["id"]): silver_label(spec, p) for _, p in profiles.iterrows()}
+            grades = {pid: g for pid, g in grades.items() if g > 0}
+            fixture = {
+                "offer_id": spec["offer_id"],
+                "offer_text": spec["offer_text"],
+                "relevant": sorted(grades),
+                "grades": {str(pid): g for pid, g in sorted(grades.items())},
+                "label_source": "silver",
+            }
+            f.write(json.dumps(fixture, ensure_ascii=False) + "\n")
+            print(f"{spec['offer_id']:24s} {len(grades):4d} profils pertinents")
+
+
+# --- Métriques ---
+def load_fixtures(path: Path):
+    from bulk_match import offer_text_of
+    fixtures = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            relevant = [int(pid) for pid in record["relevant"]]
+            grades = {int(pid): float(g) for pid, g in record.get("grades", {}).items()} or {pid: 1.0 for pid in relevant}
+            fixtures.append({
+                "offer_id": str(record.get("offer_id", len(fixtures))),
+                "text": offer_text_of(record),
+                "relevant": set(relevant),
+                "grades": grades,
+            })
+    return fixtures
+
+
+def precision_at(ranking, relevant, n):
+    return len(set(ranking[:n]) & relevant) / n
+
+
+def recall_at(ranking, relevant, k):
+    return len(set(ranking[:k]) & relevant) / len(relevant) if relevant else None
+
+
+def ndcg_at(ranking, grades, k):
+    dcg = sum((2 ** grades.get(pid, 0) - 1) / math.log2(i + 2) for i, pid in enumerate(ranking[:k]))
+    ideal = sorted(grades.values(), reverse=True)[:k]
+    idcg = sum((2 ** g - 1) / math.log2(i + 2) for i, g in enumerate(ideal))
+    return dcg / idcg if idcg > 0 else None
+
+
+def mean(values):
+    values = [v for v in values if v is not None]
+    return float(np.mean(values)) if values else None
+
+
+# --- Exécution d'une configuration (processus neuf) ---
+def run_worker(fixtures_path: Path, k: int, repeat: int):
+    import logging
+    from api import main as engine
+    logging.getLogger(engine.__name__).setLevel(logging.WARNING)
+
+    t0 = time.perf_counter()
+    engine.load_models(with_offers=False)
+    load_s = time.perf_counter() - t0
+    fixtures = load_fixtures(fixtures_path)
+
+    engine.match_offer_sync(fixtures[0]["text"], k)  # échauffement
+    rankings, latencies = {}, []
+    for _ in range(repeat):
+        for fixture in fixtures:
+            t0 = time.perf_counter()
+            results = engine.match_offer_sync(fixture["text"], k, with_explanation=True)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            rankings[fixture["offer_id"]] = [r.id for r in results]
+
+    print(json.dumps({
+        "rankings": rankings,
+        "latencies_ms": latencies,
+        "load_s": load_s,
+        "state_bytes": engine.state_nbytes(engine.ml_models),
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }))
+
+
+def run_config(name: str, env: dict, fixtures_path: Path, k: int, repeat: int):
+    # Pas de snapshot (construit pour une autre configuration) ni de cache d'embeddings d'offres
+    config_env = {**os.environ, "SNAPSHOT_PATH": str(BACKEND_DIR / ".no-snapshot"), "OFFER_EMBEDDING_CACHE_SIZE": "0", **env}
+    proc = subprocess.run(
+        # Chemins absolus : le worker tourne dans BACKEND_DIR, quel que soit le répertoire de lancement
+        [sys.executable, str(Path(__file__).resolve()), str(fixtures_path.resolve()), "--worker", "--k", str(k), "--repeat", str(repeat)],
+        cwd=BACKEND_DIR, env=config_env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        print(f"{name}: échec\n{proc.stderr[-2000:]}")
+        return None
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("fixtures", type=Path, help="Fixtures JSONL (offre -> profils pertinents)")
+    parser.add_argument("--configs", type=Path, help="JSON {nom: {VARIABLE: valeur}} (configurations par défaut sinon)")
+    parser.add_argument("--k", type=int, default=7, help="top_k demandé (recall@k, nDCG@k)")
+    parser.add_argument("--repeat", type=int, default=3, help="Passages sur les fixtures pour la latence")
+    parser.add_argument("--output", type=Path, help="Écrire le rapport complet en JSON")
+    parser.add_argument("--make-silver", action="store_true", help="Générer le jeu silver dans le fichier fixtures")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.make_silver:
+        make_silver(args.fixtures)
+        return
+    if args.worker:
+        run_worker(args.fixtures, args.k, args.repeat)
+        return
+
+    configs = json.loads(args.configs.read_text()) if args.configs else DEFAULT_CONFIGS
+    fixtures = load_fixtures(args.fixtures)
+    reference = None
+    report = {}
+    for name, env in configs.items():
+        run = run_config(name, env, args.fixtures, args.k, args.repeat)
+        if run is None:
+            continue
+        rankings = run["rankings"]
+        if reference is None:
+            reference = rankings
+        report[name] = {
+            "env": env,
+            "precision@7": mean(precision_at(rankings[f["offer_id"]], f["relevant"], 7) for f in fixtures),
+            f"recall@{args.k}": mean(recall_at(rankings[f["offer_id"]], f["relevant"], args.k) for f in fixtures),
+            f"ndcg@{args.k}": mean(ndcg_at(rankings[f["offer_id"]], f["grades"], args.k) for f in fixtures),
+            "overlap_with_reference": mean(
+                len(set(rankings[o][:args.k]) & set(reference[o][:args.k])) / args.k for o in rankings),
+            "latency_p50_ms": float(np.percentile(run["latencies_ms"], 50)),
+            "latency_p95_ms": float(np.percentile(run["latencies_ms"], 95)),
+            "load_s": run["load_s"],
+            "state_mb": run["state_bytes"] / 1e6,
+            "peak_rss_mb": run["peak_rss_kb"] / 1024,
+        }
+
+    print(f"\n=== {len(fixtures)} offres, top_k={args.k}, {args.repeat} passages ===")
+    print(f"{'configuration':18s} {'P@7':>6s} {'R@' + str(args.k):>6s} {'nDCG':>6s} {'recouv.':>8s} "
+          f"{'p50 ms':>8s} {'p95 ms':>8s} {'état Mo':>8s} {'RSS Mo':>8s}")
+    for name, r in report.items():
+        print(f"{name:18s} {r['precision@7']:6.3f} {r[f'recall@{args.k}']:6.3f} {r[f'ndcg@{args.k}']:6.3f} "
+              f"{r['overlap_with_reference']:8.3f} {r['latency_p50_ms']:8.2f} {r['latency_p95_ms']:8.2f} "
+              f"{r['state_mb']:8.2f} {r['peak_rss_mb']:8.0f}")
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()